@@ -13,6 +13,7 @@ configuration convenience functions are in 'config_helpers'.
 '''
 from .singleton import Singleton
 from .loggable import Loggable, LoggableChild
+from .metrics import Metrics
 from .scanrepo import ScanRepo, SingletonScanner, Prepuller, Reaper
 from .lsstmgr import LSSTMiddleManager
 from .spawner import LSSTSpawner
@@ -33,4 +34,5 @@ __all__ = [LSSTMiddleManager, Prepuller, Reaper, ScanRepo, Singleton,
            list_duplicates, list_digest, get_access_token,
            parse_access_token, assemble_gids, make_passwd_line,
            make_group_lines, add_user_to_groups, get_supplemental_gids,
-           resolve_groups, LSSTConfig, Loggable, LoggableChild, __version__]
+           resolve_groups, LSSTConfig, Loggable, LoggableChild, Metrics,
+           __version__]
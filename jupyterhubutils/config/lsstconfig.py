@@ -109,6 +109,18 @@ class LSSTConfig(metaclass=Singleton):
             os.getenv('INITIAL_SCAN_INTERVAL'), 0.2)
         self.max_scan_interval = floatify(
             os.getenv('MAX_SCAN_INTERVAL'), 5.0)
+        # Settings for repository scan refresh
+        self.scan_min_refresh_time = intify(
+            os.getenv('SCAN_MIN_REFRESH_TIME'), 60)
+        self.scan_max_cache_age = intify(os.getenv('SCAN_MAX_CACHE_AGE'), 600)
+        self.scan_adaptive_refresh = str_bool(
+            os.getenv('SCAN_ADAPTIVE_REFRESH'))
+        self.scan_adaptive_min_age = intify(
+            os.getenv('SCAN_ADAPTIVE_MIN_AGE'), self.scan_min_refresh_time)
+        self.scan_adaptive_max_age = intify(
+            os.getenv('SCAN_ADAPTIVE_MAX_AGE'), 3600)
+        self.scan_adaptive_history_days = intify(
+            os.getenv('SCAN_ADAPTIVE_HISTORY_DAYS'), 28)
         self.tiny_cpu_max = floatify(os.getenv('TINY_CPU_MAX'), 0.5)
         self.mb_per_cpu = intify(os.getenv('MB_PER_CPU'), 2048)
         self.size_index = intify(os.getenv('SIZE_INDEX'), 1)
@@ -162,6 +174,9 @@ class LSSTConfig(metaclass=Singleton):
         self.lab_repo_owner = os.getenv('LAB_REPO_OWNER') or 'lsstsqre'
         self.lab_repo_name = os.getenv('LAB_REPO_NAME') or 'sciplat-lab'
         self.lab_repo_host = os.getenv('LAB_REPO_HOST') or 'hub.docker.com'
+        # Spawner records image selections here (if set) for the
+        #  prepuller's usage-weighted mode.
+        self.image_usage_file = os.getenv('IMAGE_USAGE_FILE')
         self.prepuller_namespace = (os.getenv('PREPULLER_NAMESPACE') or
                                     get_execution_namespace())
         self.prepuller_experimentals = intify(
@@ -174,6 +189,35 @@ class LSSTConfig(metaclass=Singleton):
         self.prepuller_cachefile = os.getenv('PREPULLER_CACHEFILE',
                                              '/tmp/repo-cache.json')
         self.prepuller_timeout = os.getenv('PREPULLER_TIMEOUT', 3300)
+        self.prepuller_mode = os.getenv('PREPULLER_MODE') or 'pods'
+        self.prepuller_daemon = str_bool(os.getenv('PREPULLER_DAEMON'))
+        self.prepuller_rescan_interval = intify(
+            os.getenv('PREPULLER_RESCAN_INTERVAL'), 600)
+        self.prepuller_orphan_age = intify(
+            os.getenv('PREPULLER_ORPHAN_AGE'), 3600)
+        self.prepuller_pause_image = (os.getenv('PREPULLER_PAUSE_IMAGE') or
+                                      'k8s.gcr.io/pause:3.2')
+        self.prepuller_skip_present = str_bool(
+            os.getenv('PREPULLER_SKIP_PRESENT'))
+        self.prepuller_max_pulls = intify(os.getenv('PREPULLER_MAX_PULLS'),
+                                          32)
+        self.prepuller_pulls_per_node = intify(
+            os.getenv('PREPULLER_PULLS_PER_NODE'), 1)
+        self.prepuller_order_by_layers = str_bool(
+            os.getenv('PREPULLER_ORDER_BY_LAYERS'))
+        self.prepuller_usage_weighted = str_bool(
+            os.getenv('PREPULLER_USAGE_WEIGHTED'))
+        self.prepuller_usage_half_life = floatify(
+            os.getenv('PREPULLER_USAGE_HALF_LIFE'), 7.0)
+        self.prepuller_disk_budget = floatify(
+            os.getenv('PREPULLER_DISK_BUDGET'), 0.0)
+        self.prepuller_report_file = os.getenv('PREPULLER_REPORT_FILE')
+        self.prepuller_longest_first = str_bool(
+            os.getenv('PREPULLER_LONGEST_FIRST'))
+        self.prepuller_pin_digests = str_bool(
+            os.getenv('PREPULLER_PIN_DIGESTS'))
+        self.prepuller_qps = floatify(os.getenv('PREPULLER_QPS'), 10.0)
+        self.prepuller_burst = intify(os.getenv('PREPULLER_BURST'), 20)
         cstr = "echo \"Prepuller for $(hostname) completed at $(date).\""
         self.prepuller_command = ["/bin/sh", "-c", cstr]
         prp_cmd = os.getenv('PREPULLER_COMMAND_JSON')
@@ -186,6 +230,13 @@ class LSSTConfig(metaclass=Singleton):
             os.getenv('REAPER_KEEP_DAILIES'), 15)
         self.reaper_keep_weeklies = intify(
             os.getenv('REAPER_KEEP_WEEKLIES'), 78)
+        self.reaper_max_age_experimentals = intify(
+            os.getenv('REAPER_MAX_AGE_EXPERIMENTALS'), 0)
+        self.reaper_max_age_dailies = intify(
+            os.getenv('REAPER_MAX_AGE_DAILIES'), 0)
+        self.reaper_max_age_weeklies = intify(
+            os.getenv('REAPER_MAX_AGE_WEEKLIES'), 0)
+        self.reaper_concurrency = intify(os.getenv('REAPER_CONCURRENCY'), 8)
         # Fileserver settings
         self.fileserver_host = (os.getenv('EXTERNAL_FILESERVER_IP') or
                                 os.getenv('FILESERVER_SERVICE_HOST'))
@@ -195,6 +246,9 @@ class LSSTConfig(metaclass=Singleton):
         # Hub internal settings
         my_ip = public_ips()[0]
         self.instance_name = os.getenv('INSTANCE_NAME')
+        # Only watch this instance's pods (by label) in this hub's user
+        #  namespaces.  Turn on once all user pods carry the label.
+        self.scope_reflectors = str_bool(os.getenv('SCOPE_REFLECTORS'))
         self.hub_host = os.getenv('HUB_SERVICE_HOST') or my_ip
         self.hub_api_port = os.getenv('HUB_SERVICE_PORT_API') or 8081
         self.proxy_host = os.getenv('PROXY_SERVICE_HOST') or my_ip
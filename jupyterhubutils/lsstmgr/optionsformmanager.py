@@ -44,6 +44,13 @@ class LSSTOptionsFormManager(LoggableChild):
                             weeklies=cfg.prepuller_weeklies,
                             releases=cfg.prepuller_releases,
                             cachefile=cfg.prepuller_cachefile,
+                            min_refresh_time=cfg.scan_min_refresh_time,
+                            max_cache_age=cfg.scan_max_cache_age,
+                            adaptive_refresh=cfg.scan_adaptive_refresh,
+                            adaptive_min_age=cfg.scan_adaptive_min_age,
+                            adaptive_max_age=cfg.scan_adaptive_max_age,
+                            adaptive_history_days=(
+                                cfg.scan_adaptive_history_days),
                             debug=cfg.debug)
             self._scanner = scanner
             self.log.debug("Calling _sync_scan() for '{}'.".format(uname))
@@ -0,0 +1,5 @@
+'''Lightweight in-process metrics collection.
+'''
+from .metrics import Metrics
+
+__all__ = [Metrics]
@@ -0,0 +1,112 @@
+import contextlib
+import threading
+import time
+
+
+class Metrics(object):
+    '''Thread-safe bag of counters, gauges, and timers.  Its contents can
+    be retrieved as a dict snapshot or rendered in the Prometheus text
+    exposition format.  Metric names should be snake_case; `prefix` is
+    prepended (with an underscore) when rendering for Prometheus.
+    '''
+
+    def __init__(self, prefix='jupyterhubutils'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._timers = {}
+
+    def inc(self, name, value=1):
+        '''Increment a counter.
+        '''
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set(self, name, value):
+        '''Set a gauge to a value.
+        '''
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, seconds):
+        '''Record one duration (in seconds) for a timer.
+        '''
+        with self._lock:
+            tmr = self._timers.get(name)
+            if not tmr:
+                tmr = {"count": 0, "total": 0.0, "last": 0.0, "max": 0.0}
+                self._timers[name] = tmr
+            tmr["count"] += 1
+            tmr["total"] += seconds
+            tmr["last"] = seconds
+            if seconds > tmr["max"]:
+                tmr["max"] = seconds
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        '''Context manager to time the enclosed block.
+        '''
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - start)
+
+    def get_counter(self, name):
+        '''Return the current value of a counter (zero if never set).
+        '''
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def get_gauge(self, name, default=None):
+        '''Return the current value of a gauge.
+        '''
+        with self._lock:
+            return self._gauges.get(name, default)
+
+    def reset(self):
+        '''Discard all collected values.
+        '''
+        with self._lock:
+            self._counters = {}
+            self._gauges = {}
+            self._timers = {}
+
+    def snapshot(self):
+        '''Return a point-in-time copy of all metrics as a dict.
+        '''
+        with self._lock:
+            return {"counters": dict(self._counters),
+                    "gauges": dict(self._gauges),
+                    "timers": {k: dict(v) for k, v in self._timers.items()}}
+
+    def to_prometheus(self, extra_gauges=None):
+        '''Render metrics in Prometheus text format.  `extra_gauges` is an
+        optional dict of additional (computed) gauge values.
+        '''
+        snap = self.snapshot()
+        gauges = snap["gauges"]
+        if extra_gauges:
+            gauges.update(extra_gauges)
+        lines = []
+        for name in sorted(snap["counters"]):
+            mname = "{}_{}_total".format(self.prefix, name)
+            lines.append("# TYPE {} counter".format(mname))
+            lines.append("{} {}".format(mname, snap["counters"][name]))
+        for name in sorted(gauges):
+            val = gauges[name]
+            if val is None:
+                continue
+            mname = "{}_{}".format(self.prefix, name)
+            lines.append("# TYPE {} gauge".format(mname))
+            lines.append("{} {}".format(mname, val))
+        for name in sorted(snap["timers"]):
+            tmr = snap["timers"][name]
+            mname = "{}_{}_seconds".format(self.prefix, name)
+            lines.append("# TYPE {} summary".format(mname))
+            lines.append("{}_sum {}".format(mname, tmr["total"]))
+            lines.append("{}_count {}".format(mname, tmr["count"]))
+            lines.append("# TYPE {}_last gauge".format(mname))
+            lines.append("{}_last {}".format(mname, tmr["last"]))
+        return "\n".join(lines) + "\n"
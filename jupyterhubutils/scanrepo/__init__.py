@@ -3,7 +3,10 @@
 from .scanrepo import ScanRepo
 from .standalone import standalone
 from .singletonscanner import SingletonScanner
+from .retention import (RetentionEngine, RetentionPolicy, CountPolicy,
+                        AgePolicy, CombinedPolicy)
 from .reaper import Reaper
+from .usagestore import UsageStore
 from .reaperstandalone import reaperstandalone
 from .prepuller import Prepuller
 from .prepullerstandalone import prepullerstandalone
@@ -11,4 +14,5 @@ from .parse_args import parse_args
 from .primerepocache import prime_repo_cache
 __all__ = [ScanRepo, SingletonScanner, Reaper, Prepuller,
            standalone, reaperstandalone, prepullerstandalone, parse_args,
-           prime_repo_cache]
+           prime_repo_cache, RetentionEngine, RetentionPolicy, CountPolicy,
+           AgePolicy, CombinedPolicy, UsageStore]
@@ -122,10 +122,153 @@ def parse_args(cfg=LSSTConfig(),
             parser.add_argument("--namespace",
                                 help="Kubernetes namespace [{}]".format(ppn),
                                 default=ppn)
+            pdm = cfg.prepuller_daemon
+            parser.add_argument("--daemon", action='store_true',
+                                help=("Run continuously, prepulling onto " +
+                                      "new nodes and pulling new images " +
+                                      "(pods mode only) [{}]".format(pdm)),
+                                default=pdm)
+            pri = cfg.prepuller_rescan_interval
+            parser.add_argument("--rescan-interval", type=int,
+                                help=("Seconds between repository rescans " +
+                                      "in daemon mode [{}]".format(pri)),
+                                default=pri)
+            poa = cfg.prepuller_orphan_age
+            parser.add_argument("--orphan-age", type=int,
+                                help=("Seconds after which a running " +
+                                      "prepuller pod from another run " +
+                                      "is considered orphaned " +
+                                      "[{}]".format(poa)),
+                                default=poa)
+            pmo = cfg.prepuller_mode
+            parser.add_argument("--mode",
+                                choices=["pods", "daemonset",
+                                         "daemonset-per-image"],
+                                help=("Prepull with a pod per node and " +
+                                      "image, one DaemonSet, or a " +
+                                      "DaemonSet per image " +
+                                      "[{}]".format(pmo)),
+                                default=pmo)
+            ppi = cfg.prepuller_pause_image
+            parser.add_argument("--pause-image",
+                                help=("Idle container image for " +
+                                      "DaemonSet modes [{}]".format(ppi)),
+                                default=ppi)
+            pmp = cfg.prepuller_max_pulls
+            parser.add_argument("--max-pulls", type=int,
+                                help=("Maximum image pulls in flight " +
+                                      "across all nodes [{}]".format(pmp)),
+                                default=pmp)
+            ppp = cfg.prepuller_pulls_per_node
+            parser.add_argument("--pulls-per-node", type=int,
+                                help=("Maximum image pulls in flight " +
+                                      "per node [{}]".format(ppp)),
+                                default=ppp)
+            pqp = cfg.prepuller_qps
+            parser.add_argument("--qps", type=float,
+                                help=("Kubernetes API requests per " +
+                                      "second (0 for no limit) " +
+                                      "[{}]".format(pqp)),
+                                default=pqp)
+            pbu = cfg.prepuller_burst
+            parser.add_argument("--burst", type=int,
+                                help=("Kubernetes API request burst " +
+                                      "[{}]".format(pbu)),
+                                default=pbu)
+            pol = cfg.prepuller_order_by_layers
+            parser.add_argument("--order-by-layers", action='store_true',
+                                help=("Fetch image layer lists and pull " +
+                                      "images sharing layers in " +
+                                      "superset-first order " +
+                                      "[{}]".format(pol)),
+                                default=pol)
+            puw = cfg.prepuller_usage_weighted
+            parser.add_argument("--usage-weighted", action='store_true',
+                                help=("Pull images in order of recent use " +
+                                      "in spawns (overrides " +
+                                      "--order-by-layers) [{}]".format(puw)),
+                                default=puw)
+            puf = cfg.image_usage_file
+            parser.add_argument("--usage-file",
+                                help=("Image usage file written by the " +
+                                      "spawner [{}]".format(puf)),
+                                default=puf)
+            puh = cfg.prepuller_usage_half_life
+            parser.add_argument("--usage-half-life", type=float,
+                                help=("Days for an image use to lose half " +
+                                      "its weight [{}]".format(puh)),
+                                default=puh)
+            pdb = cfg.prepuller_disk_budget
+            parser.add_argument("--disk-budget", type=float,
+                                help=("GiB per node to spend on usage-" +
+                                      "weighted prepulls (0 for no " +
+                                      "limit) [{}]".format(pdb)),
+                                default=pdb)
+            prf = cfg.prepuller_report_file
+            parser.add_argument("--report-file",
+                                help=("Write per-run pull timing report " +
+                                      "to this file [{}]".format(prf)),
+                                default=prf)
+            plf = cfg.prepuller_longest_first
+            parser.add_argument("--longest-first", action='store_true',
+                                help=("Schedule the pulls that took " +
+                                      "longest in the last report first " +
+                                      "[{}]".format(plf)),
+                                default=plf)
+            ppd = cfg.prepuller_pin_digests
+            parser.add_argument("--pin-digests", action='store_true',
+                                help=("Pull the digests the repo scan " +
+                                      "resolved, with IfNotPresent, " +
+                                      "instead of tags with Always " +
+                                      "[{}]".format(ppd)),
+                                default=ppd)
+            psp = cfg.prepuller_skip_present
+            parser.add_argument("--skip-present", action='store_true',
+                                help=("Do not pull images whose digest " +
+                                      "the node already has [{}]".format(
+                                          psp)),
+                                default=psp)
         if component == "reaper":
             parser.add_argument("--dry-run", action='store_true',
                                 help="Don't actually delete images",
                                 default=False)
+            for cat, mage in [("experimentals",
+                               cfg.reaper_max_age_experimentals),
+                              ("dailies", cfg.reaper_max_age_dailies),
+                              ("weeklies", cfg.reaper_max_age_weeklies)]:
+                parser.add_argument("--max-age-{}".format(cat), type=int,
+                                    help=("Maximum age in days of {} " +
+                                          "to keep (0 for no limit) " +
+                                          "[{}]").format(cat, mage),
+                                    default=mage)
+            parser.add_argument("--reap-if-any", action='store_true',
+                                help=("With both count and age limits, " +
+                                      "reap images exceeding either one " +
+                                      "[False]"),
+                                default=False)
+            rcc = cfg.reaper_concurrency
+            parser.add_argument("-c", "--concurrency", type=int,
+                                help=("Maximum concurrent deletions " +
+                                      "[{}]".format(rcc)),
+                                default=rcc)
+            parser.add_argument("--plan", metavar="PLANFILE",
+                                help=("Write deletion plan to PLANFILE " +
+                                      "instead of deleting images"),
+                                default=None)
+            parser.add_argument("--apply", metavar="PLANFILE",
+                                help=("Delete images listed in PLANFILE " +
+                                      "without rescanning"),
+                                default=None)
+            parser.add_argument("--recheck", action='store_true',
+                                help=("With --apply, rescan the " +
+                                      "repository and skip victims " +
+                                      "whose digests a kept tag now " +
+                                      "references [False]"),
+                                default=False)
+            parser.add_argument("--journal",
+                                help=("Progress journal for --apply " +
+                                      "[PLANFILE.journal]"),
+                                default=None)
         results = parser.parse_args()
         results.path = ("/v2/repositories/" + results.owner + "/" +
                         results.name + "/tags/")
@@ -0,0 +1,200 @@
+import logging
+import threading
+import time
+from eliot import start_action
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+from ..utils import make_logger
+
+
+class ExpiryWatch(watch.Watch):
+    '''A watch that notes (as `gone`) when the API server says our
+    resource version has expired (410), even if the client then swallows
+    that and just ends the stream, as clients 12 through 16 do when
+    `timeout_seconds` is set.
+    '''
+
+    gone = False
+
+    def unmarshal_event(self, data, return_type):
+        js = super().unmarshal_event(data, return_type)
+        obj = js.get('raw_object')
+        if (js.get('type') == 'ERROR' and isinstance(obj, dict) and
+                obj.get('code') == 410):
+            self.gone = True
+        return js
+
+
+class PodWatcher(object):
+    '''Track pod phases in a namespace with a single label-selected watch,
+    so that any number of threads can wait for their pods to finish
+    without each polling the API server.
+
+    Call `register()` with a pod name before creating the pod, and then
+    `wait()` for it to reach a terminal phase.
+    '''
+
+    terminal_phases = ["Succeeded", "Failed", "Deleted"]
+
+    def __init__(self, api, namespace, label_selector, timeout_seconds=300,
+                 rate_limiter=None, on_phase=None, debug=False):
+        self.logger = make_logger()
+        self.debug = debug
+        if self.debug:
+            self.logger.setLevel(logging.DEBUG)
+        self.api = api
+        self.namespace = namespace
+        self.label_selector = label_selector
+        self.timeout_seconds = timeout_seconds
+        self.rate_limiter = rate_limiter
+        # Called as on_phase(podname, phase) on every phase change.
+        self.on_phase = on_phase
+        self.resource_version = None
+        self._phases = {}
+        self._waiters = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        '''Start the watch thread.
+        '''
+        with start_action(action_type="podwatcher_start"):
+            if self._thread:
+                return
+            # Each watch thread gets its own stop event, so a stopped
+            #  thread that hasn't noticed yet can't be revived.
+            self._stop_event = threading.Event()
+            with self._lock:
+                self._stopped = False
+            self._thread = threading.Thread(target=self._watch,
+                                            args=(self._stop_event,))
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        '''Stop the watch thread (at the next event or watch timeout) and
+        release any waiters.  Until the watcher is started again, waits
+        return None at once, since nothing would ever end them.
+        '''
+        with start_action(action_type="podwatcher_stop"):
+            self._stop_event.set()
+            with self._lock:
+                self._stopped = True
+                for evt in self._waiters.values():
+                    evt.set()
+            self._thread = None
+
+    def register(self, podname):
+        '''Begin tracking a pod; forget anything previously seen for it.
+        '''
+        with self._lock:
+            self._phases.pop(podname, None)
+            evt = threading.Event()
+            if self._stopped:
+                evt.set()
+            self._waiters[podname] = evt
+
+    def wait(self, podname, timeout=None):
+        '''Block until the named pod reaches a terminal phase, and return
+        that phase.  Return None if `timeout` seconds elapse first, or if
+        the watcher has been stopped.
+        '''
+        with self._lock:
+            evt = self._waiters.get(podname)
+            if not evt:
+                evt = threading.Event()
+                self._waiters[podname] = evt
+            phase = self._phases.get(podname)
+            if phase in self.terminal_phases or self._stopped:
+                evt.set()
+        evt.wait(timeout)
+        with self._lock:
+            phase = self._phases.get(podname)
+            if phase not in self.terminal_phases:
+                return None
+            self._waiters.pop(podname, None)
+            return phase
+
+    def get_phase(self, podname):
+        '''Return the last phase seen for a pod, or None.
+        '''
+        with self._lock:
+            return self._phases.get(podname)
+
+    def _update(self, podname, phase):
+        with self._lock:
+            old = self._phases.get(podname)
+            self._phases[podname] = phase
+            evt = self._waiters.get(podname)
+        if old != phase:
+            self.logger.debug(
+                "Pod '{}': {} -> {}".format(podname, old, phase))
+            if self.on_phase:
+                self.on_phase(podname, phase)
+        if evt and phase in self.terminal_phases:
+            evt.set()
+
+    def _throttle(self):
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+
+    def _relist(self):
+        self._throttle()
+        podlist = self.api.list_namespaced_pod(
+            self.namespace, label_selector=self.label_selector)
+        for pod in podlist.items:
+            self._update(pod.metadata.name, pod.status.phase)
+        self.resource_version = podlist.metadata.resource_version
+
+    def _watch(self, stop_event):
+        delay = 0.1
+        while not stop_event.is_set():
+            w = ExpiryWatch()
+            try:
+                if not self.resource_version:
+                    # Pick up anything that changed while we weren't
+                    #  watching.
+                    self._relist()
+                self._throttle()
+                for ev in w.stream(
+                        self.api.list_namespaced_pod, self.namespace,
+                        label_selector=self.label_selector,
+                        resource_version=self.resource_version,
+                        timeout_seconds=self.timeout_seconds):
+                    delay = 0.1
+                    if ev['type'] == 'ERROR':
+                        # Older clients hand us the error status rather
+                        #  than raising it.
+                        obj = ev.get('raw_object') or {}
+                        raise ApiException(status=obj.get('code'),
+                                           reason=obj.get('reason'))
+                    pod = ev['object']
+                    self.resource_version = pod.metadata.resource_version
+                    name = pod.metadata.name
+                    if ev['type'] == 'DELETED':
+                        self._update(name, "Deleted")
+                    else:
+                        self._update(name, pod.status.phase)
+                    if stop_event.is_set():
+                        break
+                if w.gone:
+                    # The client swallowed a 410; relist.
+                    self.logger.debug("Watch expired; relisting.")
+                    self.resource_version = None
+            except ApiException as exc:
+                if exc.status == 410:
+                    self.logger.debug("Watch expired; relisting.")
+                else:
+                    self.logger.error("Pod watch failed: {}".format(exc))
+                    time.sleep(delay)
+                    delay = min(delay * 2, 30)
+                self.resource_version = None
+            except Exception as exc:
+                self.logger.error("Pod watch failed: {}".format(exc))
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+                self.resource_version = None
+            finally:
+                w.stop()
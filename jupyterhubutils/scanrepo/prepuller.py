@@ -1,14 +1,23 @@
+import collections
 import copy
 import datetime
+import hashlib
 import json
 import logging
 import os
 import signal
+import threading
 import time
+import uuid
 from eliot import start_action
-from kubernetes import client, config
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from kubernetes import client, config, watch
+from kubernetes.client.rest import ApiException
 from jupyterhubutils.scanrepo import ScanRepo
-from threading import Thread
+from .podwatcher import PodWatcher
+from .prepulltelemetry import PrepullTelemetry, load_durations
+from .ratelimiter import RateLimiter
+from .usagestore import UsageStore, normalize_image
 from ..utils import make_logger
 
 
@@ -38,10 +47,38 @@ class Prepuller(object):
         except config.ConfigException:
             config.load_kube_config()
         self.client = client.CoreV1Api()
+        self.apps_client = client.AppsV1Api()
+        self.daemonsets = []
+        # All our Kubernetes API calls share one client-side rate limit.
+        self.rate_limiter = RateLimiter(qps=self.args.qps,
+                                        burst=self.args.burst)
         self.images = []
         self.nodes = []
+        # Image names (tags and digests) already present, per node
+        self.node_images = {}
+        # Digest for each image, where the repo scan resolved one
+        self.image_digests = {}
+        # Layer digests (base first) for each image, if known
+        self.image_layers = {}
+        # Sizes nodes report, by normalized image name (tag or digest)
+        self.image_sizes = {}
         self.pod_specs = {}
         self.created_pods = []
+        # All prepuller pods carry these labels, so that cleanup can find
+        #  them (including leftovers from earlier runs) by selector.
+        self.pod_labels = {"lsst.io/component": "prepuller"}
+        # Pods from this run additionally carry the run id, so that a
+        #  single watch can follow them, and an image hash.
+        self.run_id = uuid.uuid4().hex[:12]
+        self.run_labels = dict(self.pod_labels)
+        self.run_labels["lsst.io/prepuller-run"] = self.run_id
+        self.watcher = None
+        self.telemetry = PrepullTelemetry()
+        # Pull durations from the last run's report, if we have one and
+        #  want to schedule the longest pulls first.
+        self.last_durations = ({}, {})
+        if self.args.longest_first and self.args.report_file:
+            self.last_durations = load_durations(self.args.report_file)
 
         self.logger.debug("Arguments: %s" % str(args))
         self.command = self.args.command
@@ -60,8 +97,21 @@ class Prepuller(object):
         self.images = list(set(self.images))
         if self.images:
             self.images.sort()
+        self.listed_images = list(self.images)
+        # Daemon mode state: (node, image, digest) keys already handed to
+        #  a worker, and per-node queues and lane counts.
+        self.scheduled = set()
+        self._node_queues = {}
+        self._node_lanes = collections.Counter()
+        self._lane_lock = threading.Lock()
+        self._executor = None
+        self._desired = set()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
         # Not portable to non-Unixy systems.
-        if self.args.timeout >= 0:
+        if self.args.daemon:
+            self.logger.debug("Daemon mode: no timeout.")
+        elif self.args.timeout >= 0:
             self.logger.debug("Setting timeout to %d s." % self.args.timeout)
             signal.signal(signal.SIGALRM, self._timeout_handler)
             signal.alarm(self.args.timeout)
@@ -70,42 +120,82 @@ class Prepuller(object):
         with start_action(action_type="_timeout_handler"):
             self.logger.error(
                 "Did not complete in %d s.  Terminating." % self.args.timeout)
-            self._destroy_pods(selective=False)
+            # Keep lanes from starting any more pods.
+            self._stop_event.set()
+            if self.watcher:
+                self.watcher.stop()
+            if self.args.mode == "pods":
+                self._destroy_pods(selective=False)
+            else:
+                self.destroy_daemonsets()
             raise RuntimeError("Timed out")
 
     def _destroy_pods(self, selective=False):
-        '''Get a pod list and delete any that are still running if
-        selective is False, or any in state "Succeeded" or "Failed"
-        if selective is True.
+        '''Delete this run's prepuller pods, whatever their state, if
+        selective is False, or only those in state "Succeeded" or "Failed"
+        if selective is True.  Either way this is a single label-selected
+        call.  Pods from other runs (which may still be active) are left
+        to `clean_orphaned_pods()`.
         '''
         with start_action(action_type="_destroy_pods"):
-            self.logger.debug("Looking for pods to delete.")
-            cleanup = self._get_deletion_list(selective=selective)
-            for podname in cleanup:
-                self.delete_pod(podname)
-
-    def _get_deletion_list(self, selective=True):
-        with start_action(action_type="_get_deletion_list"):
-            cleanup = []
-            speclist = []
-            v1 = self.client
-            for x in self.pod_specs:
-                speclist.extend(self.pod_specs[x])
-            specnames = [self._derive_pod_name(x) for x in speclist]
-            podlist = v1.list_namespaced_pod(self.namespace)
+            field_selector = None
+            if selective:
+                field_selector = self._completed_selector()
+            self.logger.debug("Deleting %sprepuller pods." % (
+                "completed " if selective else ""))
+            self._delete_pod_collection(self._label_selector(self.run_labels),
+                                        field_selector=field_selector)
+
+    def _completed_selector(self):
+        return ("status.phase!=Pending," +
+                "status.phase!=Running," +
+                "status.phase!=Unknown")
+
+    def clean_orphaned_pods(self):
+        '''Delete prepuller pods left by earlier runs (for instance, ones
+        that crashed or were killed).  Their names can collide with the
+        pods this run wants to create.  Completed pods from other runs go
+        in one call; pods that are still running are only deleted once
+        they are older than `orphan_age` seconds, since they may belong to
+        a daemon or another run that is still active.
+        '''
+        with start_action(action_type="clean_orphaned_pods"):
+            selector = self._label_selector(
+                extra=["lsst.io/prepuller-run!=" + self.run_id])
+            self.logger.debug("Deleting orphaned prepuller pods.")
+            self._delete_pod_collection(
+                selector, field_selector=self._completed_selector())
+            podlist = self._api(self.client.list_namespaced_pod,
+                                self.namespace, label_selector=selector)
+            now = datetime.datetime.now(datetime.timezone.utc)
             for pod in podlist.items:
+                created = pod.metadata.creation_timestamp
+                if not created:
+                    continue
+                age = (now - created).total_seconds()
+                if age < self.args.orphan_age:
+                    continue
                 podname = pod.metadata.name
-                phase = pod.status.phase
-                if podname in specnames:
-                    if selective:
-                        if (phase != "Succeeded" and phase != "Failed"):
-                            self.logger.debug("Pod '%s' %s; not cleaning."
-                                              % (podname, phase))
-                            continue
-                    self.logger.debug(
-                        "Pod '%s' %s; adding to cleanup." % (podname, phase))
-                    cleanup.append(podname)
-            return cleanup
+                self.logger.info("Deleting orphaned pod '%s' (%ds old)" % (
+                    podname, age))
+                try:
+                    self._api(self.client.delete_namespaced_pod, podname,
+                              self.namespace)
+                except ApiException as exc:
+                    if exc.status != 404:
+                        raise
+
+    def _delete_pod_collection(self, label_selector, field_selector=None):
+        with start_action(action_type="_delete_pod_collection"):
+            kwargs = {"label_selector": label_selector}
+            if field_selector:
+                kwargs["field_selector"] = field_selector
+            try:
+                self._api(self.client.delete_collection_namespaced_pod,
+                          self.namespace, **kwargs)
+            except ApiException as exc:
+                if exc.status != 404:
+                    raise
 
     def update_images_from_repo(self):
         '''Scan the repo looking for images.
@@ -124,6 +214,7 @@ class Prepuller(object):
                                      json=True, insecure=self.args.insecure,
                                      sort_field=self.args.sort,
                                      cachefile=self.cachefile,
+                                     fetch_layers=self.args.order_by_layers,
                                      debug=self.args.debug)
             if not self.args.no_scan:
                 if self.args.repo:
@@ -164,9 +255,13 @@ class Prepuller(object):
                             exhost = ""
                             if exhost and exhost[-1] != "/":
                                 exhost += "/"
-                            scan_imgs.append(exhost + self.args.owner + "/" +
-                                             self.args.name + ":" +
-                                             entry["name"])
+                            img = (exhost + self.args.owner + "/" +
+                                   self.args.name + ":" + entry["name"])
+                            scan_imgs.append(img)
+                            if entry.get("hash"):
+                                self.image_digests[img] = entry["hash"]
+                            if entry.get("layers"):
+                                self.image_layers[img] = entry["layers"]
                 current_imgs = [x for x in self.images]
                 # Dedupe by running the list through a set.
                 current_imgs.extend(scan_imgs)
@@ -183,7 +278,7 @@ class Prepuller(object):
             v1 = self.client
             logger = self.logger
             logger.debug("Getting schedulable node list.")
-            v1nodelist = v1.list_node()
+            v1nodelist = self._api(v1.list_node)
             nodes = []
             for thing in v1nodelist.items:
                 spec = thing.spec
@@ -195,7 +290,19 @@ class Prepuller(object):
                         continue
                 if self.reject_by_label(thing):
                     continue
-                nodes.append(thing.metadata.name)
+                name = thing.metadata.name
+                nodes.append(name)
+                # We already have the node's image list; keep it so we
+                #  need not pull what's already there.
+                present = set()
+                if thing.status and thing.status.images:
+                    for cimg in thing.status.images:
+                        present.update(cimg.names or [])
+                        if cimg.size_bytes:
+                            for iname in cimg.names or []:
+                                self.image_sizes[normalize_image(
+                                    iname)] = cimg.size_bytes
+                self.node_images[name] = present
             logger.debug("Schedulable list: %s" % str(nodes))
             self.nodes = nodes
 
@@ -237,21 +344,146 @@ class Prepuller(object):
         '''
         with start_action(action_type="build_pod_specs"):
             specs = {}
+            skipped = 0
+            images = self._pull_order()
             for node in self.nodes:
                 specs[node] = []
-                for img in self.images:
+                for img in images:
+                    if self.args.skip_present and self.image_present(
+                            node, img):
+                        self.logger.debug(
+                            "Image '%s' already on node '%s'" % (img, node))
+                        skipped += 1
+                        continue
                     specs[node].append(self._build_pod_spec(img, node))
+                if self.args.longest_first:
+                    specs[node].sort(key=lambda x: -self.expected_duration(
+                        node, self._spec_image(x)))
+            if skipped:
+                self.logger.info(
+                    "Skipping %d pulls of images already present." % skipped)
             self.pod_specs = specs
             self.logger.debug("Specs: %s" % str(self.pod_specs))
 
+    def _pull_order(self):
+        images = self.images
+        if self.args.usage_weighted:
+            images = self.rank_by_usage(images)
+        elif self.args.order_by_layers:
+            images = self.order_by_layers(images)
+        self.logger.debug("Pull order: %s" % str(images))
+        return images
+
+    def rank_by_usage(self, images):
+        '''Order images by recent use in spawns, most used first (keeping
+        the existing order among equals), and then keep, in that order,
+        those that fit within the per-node disk budget.  Image sizes come
+        from what nodes report; images no node has yet are assumed to be
+        as large as the largest known image.
+        '''
+        with start_action(action_type="rank_by_usage"):
+            scores = {}
+            if self.args.usage_file:
+                store = UsageStore(self.args.usage_file,
+                                   half_life=self.args.usage_half_life,
+                                   debug=self.debug)
+                scores = store.scores()
+            else:
+                self.logger.warning("No usage file; cannot rank by usage.")
+            ranked = sorted(images, key=lambda i: -scores.get(
+                normalize_image(i), 0.0))
+            self.logger.debug("Usage scores: %s" % str(
+                [(i, scores.get(normalize_image(i), 0.0)) for i in ranked]))
+            budget = int(self.args.disk_budget * 1024 ** 3)
+            if not budget:
+                return ranked
+            default_size = max(list(self.image_sizes.values()) or [0])
+            selected = []
+            used = 0
+            for img in ranked:
+                size = self.image_size(img) or default_size
+                if used + size > budget:
+                    self.logger.info(
+                        "Image '%s' does not fit disk budget." % img)
+                    continue
+                used += size
+                selected.append(img)
+            return selected
+
+    def image_size(self, img):
+        '''Return the size in bytes nodes report for an image, by tag or
+        by the digest the repo scan resolved, or None if unknown.
+        '''
+        size = self.image_sizes.get(normalize_image(img))
+        digest = self.image_digests.get(img)
+        if not size and digest:
+            repo = normalize_image(img).rsplit(':', 1)[0]
+            size = self.image_sizes.get(repo + "@" + digest)
+        return size
+
+    def order_by_layers(self, images):
+        '''Order images so that pulling one warms layers for those after
+        it.  Images are grouped into lineages by base layer.  Within a
+        lineage, images whose layers are a superset of more of the
+        others come first.  Lineages are then interleaved, so that
+        concurrent pulls on one node tend to fetch unrelated layers.
+        Images with no layer information go last, in their original
+        order.
+        '''
+        with start_action(action_type="order_by_layers"):
+            layers = {}
+            lineages = collections.OrderedDict()
+            unknown = []
+            for img in images:
+                ilayers = self.image_layers.get(img)
+                if not ilayers:
+                    unknown.append(img)
+                    continue
+                layers[img] = set(ilayers)
+                lineages.setdefault(ilayers[0], []).append(img)
+            for members in lineages.values():
+                members.sort(key=lambda i: (
+                    -len([o for o in members
+                          if o != i and layers[o] <= layers[i]]),
+                    -len(layers[i]),
+                    i))
+            groups = sorted(lineages.values(), key=len, reverse=True)
+            ordered = []
+            for idx in range(max([len(g) for g in groups] or [0])):
+                for grp in groups:
+                    if idx < len(grp):
+                        ordered.append(grp[idx])
+            return ordered + unknown
+
+    def image_present(self, node, img):
+        '''Return True if the node reports having the digest the repo scan
+        resolved for the image.  Without a known digest, we can't tell, so
+        return False.
+        '''
+        digest = self.image_digests.get(img)
+        if not digest:
+            return False
+        repo = img.rsplit(':', 1)[0]
+        for name in self.node_images.get(node, []):
+            if '@' not in name:
+                continue
+            nrepo, ndigest = name.split('@', 1)
+            if ndigest != digest:
+                continue
+            # Node image names are fully qualified ("docker.io/...").
+            if nrepo == repo or nrepo.endswith("/" + repo):
+                return True
+        return False
+
     def _build_pod_spec(self, img, node):
         with start_action(action_type="_build_pod_spec"):
+            ref, policy = self._image_ref(img)
             spec = client.V1PodSpec(
                 containers=[
                     client.V1Container(
                         command=self.command,
-                        image=img,
-                        image_pull_policy="Always",
+                        image=ref,
+                        image_pull_policy=policy,
                         name=self._podname_from_image(img),
                         security_context=client.V1PodSecurityContext(
                             run_as_user=self.args.uid)
@@ -260,8 +492,41 @@ class Prepuller(object):
                 restart_policy="Never",
                 node_name=node
             )
+            # Keep the tag image, and the digest it resolved to, with the
+            #  spec; a pinned reference can't be mapped back to its tag,
+            #  since several tags may share a digest.  (The client only
+            #  serializes the spec's declared fields.)
+            spec.prepull_image = img
+            spec.prepull_digest = self.image_digests.get(img)
             return spec
 
+    def _image_ref(self, img):
+        '''Return the image reference and pull policy to prepull with.
+        With `pin_digests`, that is the digest the repo scan resolved, with
+        "IfNotPresent": the pull is the same bytes on every node, and a
+        node that already has them makes no registry round trip.
+        Otherwise it is the tag, with "Always".
+        '''
+        digest = self.image_digests.get(img)
+        if not self.args.pin_digests or not digest:
+            if self.args.pin_digests:
+                self.logger.debug("No digest for '%s'; pulling tag." % img)
+            return img, "Always"
+        ref = img.rsplit(':', 1)[0] + "@" + digest
+        return ref, "IfNotPresent"
+
+    def _spec_image(self, spec):
+        # The (tag) image a spec pulls, even if it is pinned to a digest.
+        return (getattr(spec, "prepull_image", None) or
+                spec.containers[0].image)
+
+    def _schedule_key(self, node, spec):
+        # Daemon mode schedules by digest where we know it, so that a
+        #  moving tag ("recommended", "latest_*") is pulled again when it
+        #  is re-pointed.
+        return (node, self._spec_image(spec),
+                getattr(spec, "prepull_digest", None))
+
     def _podname_from_image(self, img):
         with start_action(action_type="_podname_from_image"):
             iname = '-'.join(img.split('/')[-2:])
@@ -270,8 +535,7 @@ class Prepuller(object):
             return iname
 
     def clean_completed_pods(self):
-        '''Get a pod list and delete any that are in the speclist and have
-        already run to completion.
+        '''Delete any prepuller pods that have already run to completion.
         '''
         with start_action(action_type="clean_completed_pods"):
             self._destroy_pods(selective=True)
@@ -286,39 +550,179 @@ class Prepuller(object):
         with start_action(action_type="start_single_pod"):
             v1 = self.client
             name = self._derive_pod_name(spec)
+            labels = dict(self.run_labels)
+            labels["lsst.io/prepuller-image"] = self._image_hash(
+                self._spec_image(spec))
             pod = client.V1Pod(spec=spec,
                                metadata=client.V1ObjectMeta(
-                                   name=name)
+                                   name=name,
+                                   labels=labels)
                                )
-            name = spec.containers[0].name
-            self.logger.debug("Running pod %s" % name)
-            made_pod = v1.create_namespaced_pod(self.namespace, pod)
+            if self.watcher:
+                self.watcher.register(name)
+            # Record creation first, so that no phase change the watch
+            #  reports is missed, and take it back if the create fails.
+            self.telemetry.created(name, spec.node_name,
+                                   self._spec_image(spec))
+            self.logger.debug("Running pod %s" % spec.containers[0].name)
+            try:
+                made_pod = self._api(v1.create_namespaced_pod,
+                                     self.namespace, pod)
+            except Exception:
+                self.telemetry.discard(name)
+                raise
             podname = made_pod.metadata.name
             return podname
 
     def _derive_pod_name(self, spec):
-        '''Pod name is based on image and node.
+        '''Pod name is based on image (by way of the container name, which
+        is derived from the tag even if the pull is pinned to a digest)
+        and node.
         '''
         with start_action(action_type="_derive_pod_name"):
-            return ("pp-" +
-                    self._podname_from_image(spec.containers[0].image) +
+            return ("pp-" + spec.containers[0].name +
                     "-" + spec.node_name.split('-')[-1])
 
+    def _image_hash(self, img):
+        # Image names can't be label values (too long, and they contain
+        #  '/' and ':'), so label with a hash instead.
+        return hashlib.sha256(img.encode("utf-8")).hexdigest()[:16]
+
+    def _label_selector(self, labels=None, extra=None):
+        if labels is None:
+            labels = self.pod_labels
+        terms = ["{}={}".format(k, v) for k, v in sorted(labels.items())]
+        if extra:
+            terms.extend(extra)
+        return ",".join(terms)
+
+    def start_watcher(self):
+        '''Start the single pod watch that all node threads wait on.
+        '''
+        with start_action(action_type="start_watcher"):
+            if not self.watcher:
+                self.watcher = PodWatcher(self.client, self.namespace,
+                                          self._label_selector(
+                                              self.run_labels),
+                                          rate_limiter=self.rate_limiter,
+                                          on_phase=self.telemetry.phase,
+                                          debug=self.debug)
+            self.watcher.start()
+
     def run_pods(self):
-        '''Run pods for all nodes.  Parallelize across nodes.
+        '''Run pods for all nodes.  Parallelize across nodes, using a pool
+        of at most `max_pulls` workers in total, and at most
+        `pulls_per_node` of those on any one node.
         '''
         with start_action(action_type="run_pods"):
-            tlist = []
-            for node in self.pod_specs:
-                speclist = list(self.pod_specs[node])
-                thd = Thread(target=self.run_pods_for_node,
-                             args=(node, speclist))
-                tlist.append(thd)
-                thd.start()
-            # Wait for all threads to return
-            for thd in tlist:
-                self.logger.debug("Waiting for thread '%s'" % thd.name)
-                thd.join()
+            self._stop_event.clear()
+            self.start_watcher()
+            try:
+                lanes = self._make_lanes()
+                if not lanes:
+                    self.logger.info("Nothing to pull.")
+                    return
+                self.telemetry.set_expected(
+                    sum([len(x) for x in self.pod_specs.values()]))
+                workers = min(self.args.max_pulls, len(lanes))
+                self.logger.debug("Running %d lanes on %d workers" % (
+                    len(lanes), workers))
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = {executor.submit(self._run_lane, node, queue):
+                               node for node, queue in lanes}
+                    for fut in as_completed(futures):
+                        exc = fut.exception()
+                        if exc:
+                            self.logger.error(
+                                "Prepull on node '%s' failed: %s" % (
+                                    futures[fut], exc))
+                self.report_run()
+            finally:
+                self.watcher.stop()
+
+    def get_progress(self):
+        '''Return live progress of the current run: pulls done, in flight
+        and remaining, elapsed seconds, and ETA in seconds.
+        '''
+        return self.telemetry.progress()
+
+    def _log_progress(self):
+        prog = self.get_progress()
+        eta = "unknown"
+        if prog["eta"] is not None:
+            eta = "%ds" % prog["eta"]
+        self.logger.info("Pulled %d of %d; %d in flight; ETA %s" % (
+            prog["done"], self.telemetry.expected, prog["inflight"], eta))
+
+    def report_run(self):
+        '''Log a summary of the run's telemetry and, if we have a report
+        file, write the full report there.
+        '''
+        with start_action(action_type="report_run"):
+            report = self.telemetry.report()
+            self.logger.info("Made %d pulls (%d failed) in %ds." % (
+                report["pulls"], report["failed"], report["elapsed"]))
+            crit = report["critical_path"]
+            if crit:
+                self.logger.info(
+                    "Critical path: node '%s', finished at %ds." % (
+                        crit["node"], crit["finished"]))
+            for strag in report["stragglers"]:
+                self.logger.warning(
+                    "Straggler: '%s' on node '%s' took %ds (mean %ds)." % (
+                        strag["image"], strag["node"], strag["duration"],
+                        strag["mean"]))
+            if report["slow_nodes"]:
+                self.logger.warning(
+                    "Slow nodes: %s" % ", ".join(report["slow_nodes"]))
+            if self.args.report_file:
+                self.telemetry.write_report(self.args.report_file)
+            return report
+
+    def expected_duration(self, node, img):
+        '''Return the expected pull time of an image on a node, from the
+        last run's report: that node's own time if we have it, else the
+        image's mean time, else 0.
+        '''
+        by_node, by_image = self.last_durations
+        return by_node.get((node, img), by_image.get(img, 0.0))
+
+    def _make_lanes(self):
+        # A lane is one worker's share of a node's queue; a node gets up
+        #  to pulls_per_node lanes.  Lanes are interleaved across nodes so
+        #  that, if the pool is smaller than the number of lanes, the
+        #  first wave of pulls is spread over as many nodes as possible.
+        per_node = max(self.args.pulls_per_node, 1)
+        queues = collections.OrderedDict()
+        nodes = list(self.pod_specs.keys())
+        if self.args.longest_first:
+            # Nodes expected to take longest go first.
+            nodes.sort(key=lambda n: -sum(
+                [self.expected_duration(n, self._spec_image(x))
+                 for x in self.pod_specs[n]]))
+        for node in nodes:
+            if self.pod_specs[node]:
+                queues[node] = collections.deque(self.pod_specs[node])
+        lanes = []
+        for idx in range(per_node):
+            for node, queue in queues.items():
+                if idx < len(queue):
+                    lanes.append((node, queue))
+        return lanes
+
+    def _run_lane(self, node, queue):
+        with start_action(action_type="_run_lane"):
+            while not self._stop_event.is_set():
+                try:
+                    spec = queue.popleft()  # Atomic; queue may be shared.
+                except IndexError:
+                    return
+                name = spec.containers[0].name
+                self.logger.debug("Running pod '%s' for node '%s'" % (name,
+                                                                      node))
+                podname = self.start_single_pod(spec)
+                self.wait_for_pod(podname)
+                self._log_progress()
 
     def run_pods_for_node(self, node, speclist):
         '''Execute pods one at a time, so we don't overwhelm I/O.
@@ -328,40 +732,173 @@ class Prepuller(object):
         '''
         with start_action(action_type="run_pods_for_node"):
             self.logger.debug("Running pods for node %s" % node)
-            for spec in speclist:
-                name = spec.containers[0].name
-                self.logger.debug("Running pod '%s' for node '%s'" % (name,
-                                                                      node))
-                podname = self.start_single_pod(spec)
-                self.wait_for_pod(podname)
+            self._run_lane(node, collections.deque(speclist))
+
+    def run_daemon(self):
+        '''Run until stopped, prepulling onto nodes as they appear and
+        pulling images as they appear in the repository (or as their tags
+        move to new digests).  Only new (node, image, digest) keys are
+        scheduled, on a pool of `max_pulls` workers with at most
+        `pulls_per_node` on any one node.  We reconcile whenever the node
+        watch sees a new node, and otherwise every `rescan_interval`
+        seconds.
+        '''
+        with start_action(action_type="run_daemon"):
+            self._stop_event.clear()
+            self.start_watcher()
+            self._executor = ThreadPoolExecutor(
+                max_workers=max(self.args.max_pulls, 1))
+            thd = threading.Thread(target=self._watch_nodes,
+                                   args=(self._stop_event,))
+            thd.daemon = True
+            thd.start()
+            try:
+                while not self._stop_event.is_set():
+                    self._wakeup.clear()
+                    try:
+                        self.reconcile()
+                    except Exception as exc:
+                        self.logger.error("Reconcile failed: %s" % exc)
+                    self._wakeup.wait(self.args.rescan_interval)
+            finally:
+                self._stop_event.set()
+                self._executor.shutdown(wait=False)
+                self.watcher.stop()
+
+    def stop_daemon(self):
+        '''Ask `run_daemon()` to exit.  Pulls already running are left to
+        finish.
+        '''
+        self._stop_event.set()
+        self._wakeup.set()
+
+    def reconcile(self):
+        '''Rebuild the node list and image set, and queue pulls for any
+        (node, image, digest) not already scheduled.
+        '''
+        with start_action(action_type="reconcile"):
+            # Start from the listed images, so that images that have aged
+            #  out of the repository scan drop out of the set.
+            self.images = list(self.listed_images)
+            self.update_images_from_repo()
+            self.build_nodelist()
+            self.build_pod_specs()
+            self._desired = set([(n, i, self.image_digests.get(i))
+                                 for n in self.nodes for i in self.images])
+            queued = 0
+            with self._lane_lock:
+                # Forget departed nodes and images, and superseded digests,
+                #  so that one that comes back is prepulled again.
+                self.scheduled = set([x for x in self.scheduled
+                                      if x in self._desired])
+            for node in self.nodes:
+                new = []
+                with self._lane_lock:
+                    for spec in self.pod_specs.get(node, []):
+                        key = self._schedule_key(node, spec)
+                        if key not in self.scheduled:
+                            new.append(spec)
+                            self.scheduled.add(key)
+                if new:
+                    queued += len(new)
+                    self._enqueue(node, new)
+            self.telemetry.set_expected(self.telemetry.expected + queued)
+            self.logger.info("Queued %d new pulls." % queued)
+
+    def _enqueue(self, node, specs):
+        per_node = max(self.args.pulls_per_node, 1)
+        with self._lane_lock:
+            queue = self._node_queues.setdefault(node, collections.deque())
+            queue.extend(specs)
+            while (self._node_lanes[node] < per_node and
+                   self._node_lanes[node] < len(queue)):
+                self._node_lanes[node] += 1
+                self._executor.submit(self._daemon_lane, node)
+
+    def _daemon_lane(self, node):
+        with start_action(action_type="_daemon_lane"):
+            queue = self._node_queues[node]
+            while not self._stop_event.is_set():
+                with self._lane_lock:
+                    if not queue:
+                        self._node_lanes[node] -= 1
+                        return
+                    spec = queue.popleft()
+                img = self._spec_image(spec)
+                key = self._schedule_key(node, spec)
+                if key not in self._desired:
+                    continue
+                try:
+                    podname = self.start_single_pod(spec)
+                    self.wait_for_pod(podname)
+                    self._log_progress()
+                except Exception as exc:
+                    self.logger.error(
+                        "Prepull of '%s' on node '%s' failed: %s" % (
+                            img, node, exc))
+                    # Try again at the next reconcile.
+                    with self._lane_lock:
+                        self.scheduled.discard(key)
+            with self._lane_lock:
+                self._node_lanes[node] -= 1
+
+    def _watch_nodes(self, stop_event):
+        # Wake the daemon loop when a node we haven't seen before shows
+        #  up.  Nodes we have seen, including ones we don't prepull onto
+        #  (tainted, cordoned, or excluded by label), are left to the
+        #  periodic rescan, so their heartbeat updates and the replay at
+        #  each watch restart don't trigger reconciles.
+        seen = set(self.nodes)
+        delay = 0.1
+        while not stop_event.is_set():
+            w = watch.Watch()
+            try:
+                self.rate_limiter.acquire()
+                for ev in w.stream(self.client.list_node,
+                                   timeout_seconds=300):
+                    delay = 0.1
+                    name = ev['object'].metadata.name
+                    if ev['type'] == 'DELETED':
+                        seen.discard(name)
+                    elif ev['type'] == 'ADDED' and name not in seen:
+                        seen.add(name)
+                        if name not in self.nodes:
+                            self.logger.info("New node '%s'" % name)
+                            self._wakeup.set()
+                    if stop_event.is_set():
+                        break
+            except Exception as exc:
+                self.logger.error("Node watch failed: %s" % exc)
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+            finally:
+                w.stop()
 
     def wait_for_pod(self, podname, delay=1, max_tries=3600):
         '''Wait for a particular pod to go into phase "Succeeded" or
         "Failed", and then delete the pod.
-        Raise an exception if the delay timer expires.
+        Raise an exception if it has not done so after delay * max_tries
+        seconds.  Phase changes come from the shared pod watch, so
+        waiting costs no API calls.
         '''
         with start_action(action_type="wait_for_pod"):
-            v1 = self.client
-            namespace = self.namespace
-            tries = 1
-            while True:
-                pod = v1.read_namespaced_pod(podname, namespace)
-                phase = pod.status.phase
-                if phase in ["Failed", "Succeeded"]:
-                    if phase == "Failed":
-                        self.logger.error("Pod '%s' failed" % podname)
-                    self.delete_pod(podname)
-                    return
-                if tries >= max_tries:
-                    errstr = ("Pod '%s' did not complete after " % podname +
-                              "%d %d s iterations." % (max_tries, delay))
-                    self.logger.error(errstr)
-                    raise RuntimeError(errstr)
-                pstr = "Wait %d s [%d/%d]for pod '%s' [%s]" % (
-                    delay, tries, max_tries, podname, phase)
-                self.logger.debug(pstr)
-                time.sleep(delay)
-                tries = tries + 1
+            if not self.watcher:
+                self.start_watcher()
+            timeout = delay * max_tries
+            self.logger.debug(
+                "Waiting up to %d s for pod '%s'" % (timeout, podname))
+            phase = self.watcher.wait(podname, timeout=timeout)
+            if phase is None:
+                errstr = ("Pod '%s' did not complete after " % podname +
+                          "%d s." % timeout)
+                self.logger.error(errstr)
+                raise RuntimeError(errstr)
+            if phase == "Deleted":
+                self.logger.error("Pod '%s' vanished" % podname)
+                return
+            if phase == "Failed":
+                self.logger.error("Pod '%s' failed" % podname)
+            self.delete_pod(podname)
 
     def delete_pod(self, podname):
         '''Delete a named pod.
@@ -369,4 +906,201 @@ class Prepuller(object):
         with start_action(action_type="delete_pod"):
             v1 = self.client
             self.logger.debug("Deleting pod %s" % podname)
-            v1.delete_namespaced_pod(podname, self.namespace)
+            self._api(v1.delete_namespaced_pod, podname, self.namespace)
+            self.telemetry.deleted(podname)
+
+    def _api(self, method, *args, **kwargs):
+        '''Make a Kubernetes API call, subject to the rate limit.
+        '''
+        self.rate_limiter.acquire()
+        return method(*args, **kwargs)
+
+    def build_daemonset_specs(self):
+        '''Build DaemonSets to prepull images, instead of one pod per node
+        and image.  In "daemonset" mode, there is a single DaemonSet
+        with one pull-only init container per image (so each node pulls
+        images one at a time, as in pod mode); in "daemonset-per-image"
+        mode, there is one DaemonSet per image.  Either way the scheduler
+        fans out to nodes, restricted to our node list by node affinity.
+        '''
+        with start_action(action_type="build_daemonset_specs"):
+            images = self._pull_order()
+            if self.args.skip_present:
+                # A DaemonSet is the same on every node, so we can only
+                #  drop images that every node already has.
+                images = [i for i in images if not all(
+                    [self.image_present(n, i) for n in self.nodes])]
+            if not images or not self.nodes:
+                self.logger.info("No images to prepull.")
+                self.daemonsets = []
+                return
+            if self.args.mode == "daemonset-per-image":
+                self.daemonsets = [
+                    self._build_daemonset("pp-" +
+                                          self._podname_from_image(img),
+                                          [img])
+                    for img in images]
+            else:
+                self.daemonsets = [self._build_daemonset("prepuller",
+                                                         images)]
+            self.logger.debug("DaemonSets: %s" % str(self.daemonsets))
+
+    def _build_daemonset(self, name, images):
+        with start_action(action_type="_build_daemonset"):
+            # The run id, in both name and labels, keeps us clear of any
+            #  other run's DaemonSets.
+            labels = dict(self.run_labels)
+            labels["lsst.io/prepuller-daemonset"] = name
+            name = "{}-{}".format(name, self.run_id)
+            init_ctrs = []
+            for img in images:
+                ref, policy = self._image_ref(img)
+                init_ctrs.append(client.V1Container(
+                    command=self.command,
+                    image=ref,
+                    image_pull_policy=policy,
+                    name=self._podname_from_image(img),
+                    security_context=client.V1PodSecurityContext(
+                        run_as_user=self.args.uid)
+                ))
+            # Once the init containers have run, all the images are
+            #  pulled; the pod then just idles until we delete it.
+            pause = client.V1Container(
+                image=self.args.pause_image,
+                name="pause",
+                resources=client.V1ResourceRequirements(
+                    requests={"cpu": "1m", "memory": "8Mi"})
+            )
+            affinity = client.V1Affinity(
+                node_affinity=client.V1NodeAffinity(
+                    required_during_scheduling_ignored_during_execution=(
+                        client.V1NodeSelector(node_selector_terms=[
+                            client.V1NodeSelectorTerm(match_fields=[
+                                client.V1NodeSelectorRequirement(
+                                    key="metadata.name",
+                                    operator="In",
+                                    values=list(self.nodes))])]))))
+            spec = client.V1PodSpec(
+                init_containers=init_ctrs,
+                containers=[pause],
+                affinity=affinity
+            )
+            return client.V1DaemonSet(
+                metadata=client.V1ObjectMeta(name=name, labels=labels),
+                spec=client.V1DaemonSetSpec(
+                    selector=client.V1LabelSelector(match_labels=labels),
+                    template=client.V1PodTemplateSpec(
+                        metadata=client.V1ObjectMeta(labels=labels),
+                        spec=spec)))
+
+    def run_daemonsets(self, delay=5, max_tries=720):
+        '''Create the prepull DaemonSets, wait until every scheduled pod
+        of each is ready (that is, all its images are pulled), and then
+        delete them all.
+        '''
+        with start_action(action_type="run_daemonsets"):
+            if not self.daemonsets:
+                return
+            api = self.apps_client
+            self.clean_orphaned_daemonsets()
+            for ds in self.daemonsets:
+                name = ds.metadata.name
+                self.logger.debug("Creating DaemonSet '%s'" % name)
+                self._api(api.create_namespaced_daemon_set, self.namespace,
+                          ds)
+            try:
+                self._wait_for_daemonsets(
+                    [x.metadata.name for x in self.daemonsets],
+                    delay=delay, max_tries=max_tries)
+            finally:
+                self.destroy_daemonsets()
+
+    def _wait_for_daemonsets(self, names, delay=5, max_tries=720):
+        with start_action(action_type="_wait_for_daemonsets"):
+            api = self.apps_client
+            pending = list(names)
+            tries = 0
+            while pending:
+                tries += 1
+                if tries > max_tries:
+                    errstr = ("DaemonSets %s did not complete after " %
+                              str(pending) + "%d s." % (delay * max_tries))
+                    self.logger.error(errstr)
+                    raise RuntimeError(errstr)
+                for name in list(pending):
+                    ds = self._api(api.read_namespaced_daemon_set_status,
+                                   name, self.namespace)
+                    st = ds.status
+                    desired = st.desired_number_scheduled or 0
+                    ready = st.number_ready or 0
+                    updated = st.updated_number_scheduled or 0
+                    self.logger.debug("DaemonSet '%s': %d/%d ready" % (
+                        name, ready, desired))
+                    if desired and ready >= desired and updated >= desired:
+                        self.logger.info("DaemonSet '%s' complete" % name)
+                        pending.remove(name)
+                    elif not desired and self._observed(ds):
+                        # The controller has seen our spec and wants no
+                        #  pods (no node we named is schedulable), so
+                        #  there is nothing to wait for.
+                        self.logger.warning(
+                            "DaemonSet '%s' scheduled no pods" % name)
+                        pending.remove(name)
+                if pending:
+                    time.sleep(delay)
+
+    def _observed(self, ds):
+        # Whether the DaemonSet controller has caught up with our spec, so
+        #  that the status counts describe it.
+        observed = ds.status.observed_generation
+        generation = ds.metadata.generation
+        return (observed is not None and generation is not None and
+                observed >= generation)
+
+    def destroy_daemonsets(self):
+        '''Delete this run's prepuller DaemonSets (and their pods) in one
+        call.  DaemonSets from other runs are left to
+        `clean_orphaned_daemonsets()`.
+        '''
+        with start_action(action_type="destroy_daemonsets"):
+            self.logger.debug("Deleting prepuller DaemonSets.")
+            try:
+                self._api(
+                    self.apps_client.delete_collection_namespaced_daemon_set,
+                    self.namespace,
+                    label_selector=self._label_selector(self.run_labels),
+                    propagation_policy="Background")
+            except ApiException as exc:
+                if exc.status != 404:
+                    raise
+
+    def clean_orphaned_daemonsets(self):
+        '''Delete prepuller DaemonSets (and their pods) left by earlier
+        runs that are older than `orphan_age` seconds.  Younger ones may
+        belong to another run that is still active.
+        '''
+        with start_action(action_type="clean_orphaned_daemonsets"):
+            api = self.apps_client
+            selector = self._label_selector(
+                extra=["lsst.io/prepuller-run!=" + self.run_id])
+            dslist = self._api(api.list_namespaced_daemon_set,
+                               self.namespace, label_selector=selector)
+            now = datetime.datetime.now(datetime.timezone.utc)
+            for ds in dslist.items:
+                created = ds.metadata.creation_timestamp
+                if not created:
+                    continue
+                age = (now - created).total_seconds()
+                if age < self.args.orphan_age:
+                    continue
+                name = ds.metadata.name
+                self.logger.info(
+                    "Deleting orphaned DaemonSet '%s' (%ds old)" % (
+                        name, age))
+                try:
+                    self._api(api.delete_namespaced_daemon_set, name,
+                              self.namespace,
+                              propagation_policy="Background")
+                except ApiException as exc:
+                    if exc.status != 404:
+                        raise
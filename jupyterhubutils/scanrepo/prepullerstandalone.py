@@ -11,11 +11,25 @@ def prepullerstandalone():
     args = parse_args(cfg=lc, desc="Set up DaemonSets to prepull.",
                       component="prepuller")
     prepuller = Prepuller(args=args)
+    if args.daemon:
+        if args.mode != "pods":
+            raise ValueError("Daemon mode requires --mode pods.")
+        prepuller.clean_orphaned_pods()
+        try:
+            prepuller.run_daemon()
+        except KeyboardInterrupt:
+            prepuller.stop_daemon()
+        return
     prepuller.update_images_from_repo()
     prepuller.build_nodelist()
-    prepuller.build_pod_specs()
-    prepuller.clean_completed_pods()
-    prepuller.run_pods()
+    if args.mode == "pods":
+        prepuller.build_pod_specs()
+        prepuller.clean_orphaned_pods()
+        prepuller.clean_completed_pods()
+        prepuller.run_pods()
+    else:
+        prepuller.build_daemonset_specs()
+        prepuller.run_daemonsets()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,178 @@
+'''Timing data for prepuller runs.
+'''
+import json
+import threading
+import time
+
+
+class PrepullTelemetry(object):
+    '''Record when each prepull pod is created, changes phase, and is
+    deleted, and derive per-node and per-image pull durations, the
+    critical path, stragglers, and live progress from that.
+
+    A pull's duration runs from pod creation to its first terminal phase
+    ("Succeeded" or "Failed").
+    '''
+
+    terminal_phases = ["Succeeded", "Failed"]
+
+    def __init__(self, straggler_factor=2.0):
+        self.straggler_factor = straggler_factor
+        self.started = time.time()
+        self.expected = 0
+        self._pods = {}
+        self._lock = threading.Lock()
+
+    def set_expected(self, count):
+        '''Set the number of pulls this run is expected to make.
+        '''
+        self.expected = count
+
+    def created(self, podname, node, image, when=None):
+        with self._lock:
+            self._pods[podname] = {"node": node,
+                                   "image": image,
+                                   "created": when or time.time(),
+                                   "phases": [],
+                                   "finished": None,
+                                   "result": None,
+                                   "deleted": None}
+
+    def phase(self, podname, phase, when=None):
+        with self._lock:
+            rec = self._pods.get(podname)
+            if not rec:
+                return
+            when = when or time.time()
+            rec["phases"].append([phase, when])
+            if phase in self.terminal_phases and not rec["finished"]:
+                rec["finished"] = when
+                rec["result"] = phase
+
+    def discard(self, podname):
+        '''Forget a pod that was recorded as created but never started.
+        '''
+        with self._lock:
+            self._pods.pop(podname, None)
+
+    def deleted(self, podname, when=None):
+        with self._lock:
+            rec = self._pods.get(podname)
+            if rec:
+                rec["deleted"] = when or time.time()
+
+    def pulls(self):
+        '''Return a list of finished pulls, each a dict with node, image,
+        result, start, end, and duration.
+        '''
+        with self._lock:
+            recs = [dict(x) for x in self._pods.values()]
+        return [{"node": x["node"],
+                 "image": x["image"],
+                 "result": x["result"],
+                 "start": x["created"],
+                 "end": x["finished"],
+                 "duration": x["finished"] - x["created"]}
+                for x in recs if x["finished"]]
+
+    def progress(self, now=None):
+        '''Return live progress: pulls done, in flight, and remaining,
+        elapsed seconds, and an ETA in seconds (None until a pull has
+        finished) from the throughput so far.
+        '''
+        if now is None:
+            now = time.time()
+        with self._lock:
+            done = len([x for x in self._pods.values() if x["finished"]])
+            inflight = len(self._pods) - done
+        remaining = max(self.expected - done, 0)
+        elapsed = now - self.started
+        eta = None
+        if done:
+            eta = remaining * elapsed / done
+        return {"done": done,
+                "inflight": inflight,
+                "remaining": remaining,
+                "elapsed": elapsed,
+                "eta": eta}
+
+    def report(self):
+        '''Return a per-run report: per-node busy time and pulls, per-image
+        duration statistics, the critical path (the node that finished
+        last, and its pulls in order), and straggling pulls and nodes.
+        '''
+        pulls = sorted(self.pulls(), key=lambda x: x["start"])
+        nodes = {}
+        images = {}
+        for pull in pulls:
+            nrec = nodes.setdefault(pull["node"], {"pulls": [],
+                                                   "busy": 0.0,
+                                                   "finished": 0.0})
+            nrec["pulls"].append({"image": pull["image"],
+                                  "result": pull["result"],
+                                  "duration": pull["duration"]})
+            nrec["busy"] += pull["duration"]
+            nrec["finished"] = max(nrec["finished"],
+                                   pull["end"] - self.started)
+            images.setdefault(pull["image"], []).append(pull["duration"])
+        per_image = {}
+        for img, durations in images.items():
+            per_image[img] = {"count": len(durations),
+                              "min": min(durations),
+                              "mean": sum(durations) / len(durations),
+                              "max": max(durations)}
+        critical = None
+        if nodes:
+            cnode = max(nodes, key=lambda n: nodes[n]["finished"])
+            critical = {"node": cnode,
+                        "finished": nodes[cnode]["finished"],
+                        "pulls": nodes[cnode]["pulls"]}
+        stragglers = []
+        for pull in pulls:
+            mean = per_image[pull["image"]]["mean"]
+            if (per_image[pull["image"]]["count"] > 1 and
+                    pull["duration"] > self.straggler_factor * mean):
+                stragglers.append({"node": pull["node"],
+                                   "image": pull["image"],
+                                   "duration": pull["duration"],
+                                   "mean": mean})
+        finish_times = sorted([x["finished"] for x in nodes.values()])
+        slow_nodes = []
+        if finish_times:
+            median = finish_times[len(finish_times) // 2]
+            slow_nodes = sorted([n for n in nodes if nodes[n]["finished"] >
+                                 self.straggler_factor * median])
+        return {"started": self.started,
+                "elapsed": time.time() - self.started,
+                "pulls": len(pulls),
+                "failed": len([x for x in pulls
+                               if x["result"] == "Failed"]),
+                "nodes": nodes,
+                "images": per_image,
+                "critical_path": critical,
+                "stragglers": stragglers,
+                "slow_nodes": slow_nodes}
+
+    def write_report(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, sort_keys=True, indent=4)
+
+
+def load_durations(path):
+    '''Read a report written by `PrepullTelemetry.write_report()` and
+    return (per-node-and-image, per-image) expected pull durations, as
+    dicts keyed by (node, image) and by image.  Missing or unreadable
+    reports yield empty dicts.
+    '''
+    try:
+        with open(path, "r") as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        return {}, {}
+    by_node = {}
+    for node, nrec in report.get("nodes", {}).items():
+        for pull in nrec.get("pulls", []):
+            by_node[(node, pull["image"])] = pull["duration"]
+    by_image = dict([(img, irec["mean"]) for img, irec in
+                     report.get("images", {}).items()])
+    return by_node, by_image
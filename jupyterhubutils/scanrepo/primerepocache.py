@@ -11,5 +11,12 @@ def prime_repo_cache(cfg):
                            experimentals=cfg.prepuller_experimentals,
                            dailies=cfg.prepuller_dailies,
                            weeklies=cfg.prepuller_weeklies,
-                           releases=cfg.prepuller_releases)
+                           releases=cfg.prepuller_releases,
+                           min_refresh_time=cfg.scan_min_refresh_time,
+                           max_cache_age=cfg.scan_max_cache_age,
+                           adaptive_refresh=cfg.scan_adaptive_refresh,
+                           adaptive_min_age=cfg.scan_adaptive_min_age,
+                           adaptive_max_age=cfg.scan_adaptive_max_age,
+                           adaptive_history_days=(
+                               cfg.scan_adaptive_history_days))
     scr.scan()
@@ -0,0 +1,34 @@
+import threading
+import time
+
+
+class RateLimiter(object):
+    '''Thread-safe token bucket.  `acquire()` blocks until a request may
+    be made, allowing a sustained `qps` requests per second with bursts
+    of up to `burst`.  A non-positive `qps` disables limiting.
+    '''
+
+    def __init__(self, qps=10.0, burst=20):
+        self.qps = qps
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        '''Take one token, sleeping until one is available.
+        '''
+        if self.qps <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst,
+                                   self._tokens + (now - self._last) *
+                                   self.qps)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.qps
+            time.sleep(wait)
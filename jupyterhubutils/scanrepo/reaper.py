@@ -1,18 +1,30 @@
 import datetime
+import json
 import os
 import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from eliot import start_action
+from requests.adapters import HTTPAdapter
 from . import SingletonScanner
+from .retention import (AgePolicy, CombinedPolicy, CountPolicy,
+                        RetentionEngine, TagRecord, categorize_tag)
 
 
 class Reaper(SingletonScanner):
     '''Class to allow implementation of image retention policy.
+
+    By default, the newest keep_experimentals, keep_dailies, and
+    keep_weeklies images are retained.  Setting max_age_* (in days)
+    adds an age policy for that category; with both set,
+    retention_require_all (the default) reaps only images that are both
+    outside the newest N and older than the age limit, and otherwise
+    reaps images that fail either test.  Setting a keep_* to None or 0
+    drops its count policy (so 0 reaps nothing in that category, as it
+    always has).  Arbitrary policies may instead be supplied as
+    retention_policies, a dict of category to RetentionPolicy.
     '''
 
-    _categorized_tags = {"weekly": [],
-                         "daily": [],
-                         "experimental": []
-                         }
     # We don't need to categorize releases since we never delete any of
     #  them.
 
@@ -20,49 +32,140 @@ class Reaper(SingletonScanner):
         self.keep_experimentals = kwargs.pop('keep_experimentals', 10)
         self.keep_dailies = kwargs.pop('keep_dailies', 15)
         self.keep_weeklies = kwargs.pop('keep_weeklies', 78)
+        self.max_age_experimentals = kwargs.pop('max_age_experimentals',
+                                                None)
+        self.max_age_dailies = kwargs.pop('max_age_dailies', None)
+        self.max_age_weeklies = kwargs.pop('max_age_weeklies', None)
+        self.retention_require_all = kwargs.pop('retention_require_all',
+                                                True)
+        policies = kwargs.pop('retention_policies', None)
         self.dry_run = kwargs.pop('dry_run', False)
+        self.concurrency = kwargs.pop('concurrency', 8)
+        if self.concurrency < 1:
+            self.concurrency = 1
         self.more_cowbell = self.reap
         super().__init__(**kwargs)
-        self.logger.debug(("Keeping: {} weeklies, {} dailies, and {} " +
-                           "experimentals.").format(self.keep_weeklies,
-                                                    self.keep_dailies,
-                                                    self.keep_experimentals))
+        if not policies:
+            policies = self._make_policies()
+        self.retention_engine = RetentionEngine(policies)
+        self.logger.debug("Retention policies: {}".format(policies))
+        # Docker Hub deletes tags; other registries delete manifests by
+        #  digest.
         self.delete_tags = False
-        if self.registry_url.startswith('registry.hub.docker.com'):
+        if self.registry_url.startswith('https://registry.hub.docker.com'):
             self.delete_tags = True
         self.reapable = {}
+        self.reap_results = {}
+        self._journal = None
+        self._auth_headers = {}
+        self._auth_lock = threading.Lock()
+
+    def _make_policies(self):
+        policies = {}
+        settings = {
+            "experimental": (self.keep_experimentals,
+                             self.max_age_experimentals),
+            "daily": (self.keep_dailies, self.max_age_dailies),
+            "weekly": (self.keep_weeklies, self.max_age_weeklies)
+        }
+        for category, (keep, max_age) in settings.items():
+            plist = []
+            if keep:
+                plist.append(CountPolicy(keep))
+            if max_age:
+                plist.append(AgePolicy(max_age))
+            if len(plist) == 1:
+                policies[category] = plist[0]
+            elif plist:
+                policies[category] = CombinedPolicy(
+                    plist, require_all=self.retention_require_all)
+        return policies
 
-    def _categorize_tags(self):
-        with start_action(action_type="_categorize_tags"):
+    def _make_tag_records(self):
+        with start_action(action_type="_make_tag_records"):
             tags = self.get_all_tags()  # Should wait for initial scan
+            records = []
             for t in tags:
-                if t.startswith('w'):
-                    self._categorized_tags["weekly"].append(t)
-                elif t.startswith('d'):
-                    self._categorized_tags["daily"].append(t)
-                elif t.startswith('exp'):
-                    self._categorized_tags["experimental"].append(t)
-            for i in ["experimental", "daily", "weekly"]:
-                self._categorized_tags[i].sort(
-                    key=lambda tag: datetime.datetime.strptime(
-                        self._results_map[tag]["last_updated"].replace(
-                            "Z", "UTC"),
-                        "%Y-%m-%dT%H:%M:%S.%f%Z"))
+                category = categorize_tag(t)
+                if not category:
+                    continue
+                res = self._results_map[t]
+                records.append(TagRecord(
+                    name=t,
+                    category=category,
+                    updated=self._convert_time(res["last_updated"]),
+                    digest=self._tag_digest(t)))
+            return records
 
     def _select_victims(self):
         with start_action(action_type="_select victims"):
-            self._categorize_tags()
-            reaptags = []
-            sc = self._categorized_tags
-            reaptags.extend(sc["experimental"][:-(self.keep_experimentals)])
-            reaptags.extend(sc["daily"][:-(self.keep_dailies)])
-            reaptags.extend(sc["weekly"][:-(self.keep_weeklies)])
+            records = self._make_tag_records()
+            reaptags = self.retention_engine.select_victims(records)
             reapable = {}
             for r in reaptags:
-                reapable[r] = self._results_map[r]["hash"]
+                reapable[r] = self._tag_digest(r)
+            reapable = self._drop_protected(reapable)
             self.logger.debug("Images to reap: {}.".format(reapable))
             self.reapable = reapable
 
+    def _tag_digest(self, tag):
+        # Results read from the cachefile carry no digest; the manifest
+        #  map always has it if we know it at all.
+        digest = self._results_map.get(tag, {}).get("hash")
+        if not digest:
+            digest = (self._name_to_manifest.get(tag) or {}).get("hash")
+        return digest
+
+    def _drop_protected(self, reapable, protected=None):
+        '''Return `reapable` (tag to digest) without the tags whose digests
+        are still referenced by a tag we are keeping, either as far as we
+        know now or as recorded in `protected` (digest to tags).  This
+        only matters when we delete manifests by digest; deleting a Docker
+        Hub tag leaves other tags on the same image alone.
+        '''
+        if self.delete_tags:
+            return reapable
+        known = self._protected_digests(reapable.keys())
+        protected = dict(protected or {})
+        for digest, tags in known.items():
+            protected[digest] = sorted(set(protected.get(digest, []) +
+                                           tags))
+        kept = {}
+        for tag, digest in reapable.items():
+            if digest and digest in protected:
+                self.logger.info(
+                    ("Not reaping '{}': digest {} is still referenced " +
+                     "by {}.").format(tag, digest, protected[digest]))
+                continue
+            kept[tag] = digest
+        return kept
+
+    def _protected_digests(self, reaptags):
+        '''Map each digest referenced by a tag we are keeping (recommended,
+        latest*, releases, and everything not selected for reaping) to
+        the tags referencing it.  Deleting a manifest by digest removes
+        every tag pointing at it, so none of these may be deleted.
+        '''
+        victims = set(reaptags)
+        protected = {}
+        tags = set(self._results_map.keys()) | set(
+            self._name_to_manifest.keys())
+        for tag in sorted(tags):
+            if tag in victims:
+                continue
+            digest = self._tag_digest(tag)
+            if digest:
+                protected.setdefault(digest, []).append(tag)
+        return protected
+
+    def _group_by_digest(self):
+        '''Return a dict mapping each reapable digest to its tags.
+        '''
+        by_digest = {}
+        for tag, digest in self.reapable.items():
+            by_digest.setdefault(digest, []).append(tag)
+        return by_digest
+
     def report_reapable(self):
         '''Return a space-separated list of reapable images.
         '''
@@ -77,6 +180,122 @@ class Reaper(SingletonScanner):
             self._select_victims()
             self._delete_from_repo()
 
+    def plan(self, planfile):
+        '''Select images to reap and write the deletion set, with digests
+        and timestamps, to `planfile` rather than deleting anything.  The
+        plan is sorted, indented JSON, so two plans can be compared with
+        ordinary diff tools before running `apply()`.  The digests of the
+        victims that tags we are keeping still reference are recorded
+        too, so that `apply()` can protect them without a rescan.
+        '''
+        with start_action(action_type="plan"):
+            self._select_victims()
+            victims = []
+            for tag in sorted(self.reapable.keys()):
+                victims.append({
+                    "tag": tag,
+                    "digest": self.reapable[tag],
+                    "last_updated": self._results_map[tag].get(
+                        "last_updated")})
+            plan = {"registry_url": self.registry_url,
+                    "owner": self.owner,
+                    "name": self.name,
+                    "created": self._serialize_datetime(
+                        datetime.datetime.utcnow()),
+                    "victims": victims}
+            if not self.delete_tags:
+                digests = set(self.reapable.values())
+                protected = self._protected_digests(self.reapable.keys())
+                plan["protected"] = dict(
+                    [(d, t) for d, t in protected.items() if d in digests])
+            with open(planfile, 'w') as f:
+                f.write(json.dumps(plan, sort_keys=True, indent=4))
+                f.write("\n")
+            self.logger.info("Wrote plan to reap {} images to {}.".format(
+                len(victims), planfile))
+            return plan
+
+    def apply(self, planfile, journal=None, recheck=False):
+        '''Execute a plan written by `plan()`, without rescanning the
+        repository.  Each completed deletion is appended to `journal`
+        (default: the plan filename plus ".journal"), and tags already
+        recorded there as deleted (or as skipped, for want of a digest)
+        are not tried again, so an interrupted apply can simply be
+        rerun.  When deleting manifests by digest, victims whose digests
+        are referenced by a kept tag, as recorded in the plan or in the
+        cached scan results, are skipped; with `recheck`, the repository
+        is rescanned first, to catch tags that have moved since the plan
+        was written.
+        '''
+        with start_action(action_type="apply"):
+            with open(planfile) as f:
+                plan = json.load(f)
+            if plan.get("registry_url") != self.registry_url:
+                raise ValueError(
+                    "Plan {} is for '{}', not '{}'!".format(
+                        planfile, plan.get("registry_url"),
+                        self.registry_url))
+            if not journal:
+                journal = planfile + ".journal"
+            done = self._read_journal(journal)
+            reapable = {}
+            for victim in plan.get("victims", []):
+                tag = victim["tag"]
+                if tag in done:
+                    continue
+                reapable[tag] = victim["digest"]
+            if not self.delete_tags and reapable:
+                if recheck:
+                    # The plan may be stale; recheck against a fresh scan.
+                    self.get_all_tags()
+                reapable = self._drop_protected(
+                    reapable, protected=plan.get("protected"))
+            self.logger.info(
+                "Plan {}: {} images, {} already done, {} to go.".format(
+                    planfile, len(plan.get("victims", [])), len(done),
+                    len(reapable)))
+            self.reapable = reapable
+            if self.dry_run:
+                self._delete_from_repo()
+                return
+            with open(journal, 'a') as jf:
+                self._journal = jf
+                try:
+                    self._delete_from_repo()
+                finally:
+                    self._journal = None
+
+    def _read_journal(self, journal):
+        done = set()
+        try:
+            with open(journal) as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Probably a torn final write; ignore it.
+                        self.logger.warning(
+                            "Ignoring bad journal line: {}".format(line))
+                        continue
+                    if entry.get("deleted") or entry.get("skipped"):
+                        done.add(entry["tag"])
+        except FileNotFoundError:
+            self.logger.debug("No journal at {}.".format(journal))
+        return done
+
+    def _record_result(self, result):
+        jf = self._journal
+        if not jf:
+            return
+        entry = dict(result)
+        entry["time"] = self._serialize_datetime(datetime.datetime.utcnow())
+        jf.write(json.dumps(entry, sort_keys=True) + "\n")
+        jf.flush()
+        os.fsync(jf.fileno())
+
     def _delete_from_repo(self):
         with start_action(action_type="_delete_from_repo"):
             tags = list(self.reapable.keys())
@@ -86,34 +305,57 @@ class Reaper(SingletonScanner):
             if self.dry_run:
                 self.logger.info("Dry run: images to reap: {}".format(tags))
                 return
-            headers = {
-                "Accept": ("application/vnd.docker.distribution.manifest." +
-                           "v2+json")}
-            sc = 0
-            if self.registry_url.startswith("https://registry.hub.docker.com"):
+            if self.delete_tags:
                 self._delete_tags_from_docker_hub()
                 return
-            for t in tags:
-                self.logger.debug("Attempting to reap '{}'.".format(t))
-                h = self.reapable[t]
-                path = self.registry_url + "manifests/" + h
-                resp = requests.delete(path, headers=headers)
-                sc = resp.status_code
-                if sc == 401:
-                    auth_hdr = self._authenticate_to_repo(resp)
-                    headers.update(auth_hdr)  # Retry with new auth
-                    self.logger.warning("Retrying with new authentication.")
-                    resp = requests.delete(path, headers=headers)
-                    sc = resp.status_code
-                if (sc >= 200) and (sc < 300):
-                    # Got it.
-                    del(self._results_map[t])
-                else:
-                    self.logger.warning("DELETE {} => {}".format(path, sc))
-                    self.logger.warning("Headers: {}".format(resp.headers))
-                    self.logger.warning("Body: {}".format(resp.text))
-                if self.cachefile:
-                    self._writecachefile()  # Remove deleted tags
+            # Manifests are deleted by digest, and each one only once, no
+            #  matter how many victim tags point at it.
+            units = self._group_by_digest()
+            untagged = units.pop(None, [])
+            with self._make_session() as session:
+                self._run_batch(
+                    units, lambda d: self._delete_manifest(session, d))
+            if untagged:
+                self.logger.warning(
+                    "No digest known for {}; cannot reap.".format(untagged))
+            for tag in untagged:
+                # No rerun of this plan will know the digest either, so
+                #  journal these as skipped rather than leaving them to be
+                #  retried.
+                result = {"tag": tag, "digest": None, "status": None,
+                          "deleted": False, "skipped": True,
+                          "error": "No digest known"}
+                self.reap_results[tag] = result
+                self._record_result(result)
+
+    def _delete_manifest(self, session, h):
+        # Runs in a worker thread; must not touch the results map.
+        self.logger.debug("Attempting to reap '{}'.".format(h))
+        headers = {
+            "Accept": ("application/vnd.docker.distribution.manifest." +
+                       "v2+json")}
+        auth_hdr = self._auth_headers
+        headers.update(auth_hdr)
+        path = self.registry_url + "manifests/" + h
+        resp = session.delete(path, headers=headers)
+        sc = resp.status_code
+        if sc == 401:
+            with self._auth_lock:
+                # Only the first worker to see the 401 re-authenticates;
+                #  the rest pick up its token.
+                if self._auth_headers is auth_hdr:
+                    self._auth_headers = self._authenticate_to_repo(
+                        resp) or {}
+                headers.update(self._auth_headers)
+            self.logger.warning("Retrying with new authentication.")
+            resp = session.delete(path, headers=headers)
+            sc = resp.status_code
+        deleted = (sc >= 200) and (sc < 300)
+        if not deleted:
+            self.logger.warning("DELETE {} => {}".format(path, sc))
+            self.logger.warning("Headers: {}".format(resp.headers))
+            self.logger.warning("Body: {}".format(resp.text))
+        return {"status": sc, "deleted": deleted}
 
     def _delete_tags_from_docker_hub(self):
         # This is, of course, completely different from the published API
@@ -144,23 +386,83 @@ class Reaper(SingletonScanner):
                 self.logger.error("Could not acquire JWT token.")
                 return
             headers["Authorization"] = "JWT {}".format(token)
-            tags = list(self.reapable.keys())
-            for t in tags:
-                path = ("https://hub.docker.com/v2/repositories/" +
-                        self.owner + "/" + self.name + "/tags/" + t + "/")
-                self.logger.info("Deleting tag '{}'".format(t))
-                resp = requests.delete(path, headers=headers)
-                sc = resp.status_code
-                if (sc < 200) or (sc >= 300):
-                    self.logger.warning("DELETE {} => {}".format(path, sc))
-                    self.logger.warning("Headers: {}".format(resp.headers))
-                    self.logger.warning("Body: {}".format(resp.text))
-                    if sc != 404:
-                        continue
-                    # It's already gone, so remove from map!
-                del(self._results_map[t])
-            if self.cachefile:
+            # Docker Hub deletes tags, not manifests.
+            units = {t: [t] for t in self.reapable}
+            with self._make_session() as session:
+                self._run_batch(
+                    units,
+                    lambda t: self._delete_hub_tag(session, headers, t))
+
+    def _delete_hub_tag(self, session, headers, tag):
+        # Runs in a worker thread; must not touch the results map.
+        path = ("https://hub.docker.com/v2/repositories/" +
+                self.owner + "/" + self.name + "/tags/" + tag + "/")
+        self.logger.info("Deleting tag '{}'".format(tag))
+        resp = session.delete(path, headers=headers)
+        sc = resp.status_code
+        deleted = (sc >= 200) and (sc < 300)
+        if not deleted:
+            self.logger.warning("DELETE {} => {}".format(path, sc))
+            self.logger.warning("Headers: {}".format(resp.headers))
+            self.logger.warning("Body: {}".format(resp.text))
+            # If it's already gone, that's as good as deleting it.
+            deleted = (sc == 404)
+        return {"status": sc, "deleted": deleted}
+
+    def _make_session(self):
+        # One pooled session shared by all deletion workers.
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2,
+                              pool_maxsize=self.concurrency)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _run_batch(self, units, delete_func):
+        '''`units` maps each deletion key (a digest or a tag) to the tags
+        it removes.  Run `delete_func` over the keys with at most
+        `self.concurrency` requests in flight, collect a per-tag result in
+        `self.reap_results`, and then update the results map and write
+        the cachefile once for the whole batch.
+        '''
+        with start_action(action_type="_run_batch"):
+            results = {}
+            tags = [t for k in units for t in units[k]]
+            if not units:
+                self.reap_results = results
+                return results
+            workers = min(self.concurrency, len(units))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(delete_func, k): k for k in units}
+                for fut in as_completed(futures):
+                    key = futures[fut]
+                    try:
+                        outcome = fut.result()
+                    except Exception as exc:
+                        self.logger.error(
+                            "Failed to reap '{}': {}".format(key, exc))
+                        outcome = {"status": None,
+                                   "deleted": False,
+                                   "error": str(exc)}
+                    for tag in units[key]:
+                        result = {"tag": tag,
+                                  "digest": self.reapable.get(tag)}
+                        result.update(outcome)
+                        results[tag] = result
+                        self._record_result(result)
+            self.reap_results = results
+            deleted = [t for t in results if results[t]["deleted"]]
+            for tag in deleted:
+                self._results_map.pop(tag, None)
+                self._name_to_manifest.pop(tag, None)
+            failed = sorted(set(tags) - set(deleted))
+            self.logger.info("Reaped {} of {} images.".format(
+                len(deleted), len(tags)))
+            if failed:
+                self.logger.warning("Failed to reap: {}".format(failed))
+            if deleted and self.cachefile:
                 self._writecachefile()  # Remove deleted tags
+            return results
 
     def _authenticate_to_repo(self, resp):
         with start_action(action_type="_authenticate_to_repo"):
@@ -13,10 +13,23 @@ def reaperstandalone():
                             keep_dailies=args.dailies,
                             keep_weeklies=args.weeklies,
                             keep_experimentals=args.experimentals,
+                            max_age_dailies=args.max_age_dailies,
+                            max_age_weeklies=args.max_age_weeklies,
+                            max_age_experimentals=(
+                                args.max_age_experimentals),
+                            retention_require_all=not args.reap_if_any,
                             port=args.port, insecure=args.insecure,
                             cachefile=args.cachefile, dry_run=args.dry_run,
+                            concurrency=args.concurrency,
+                            scan_on_init=not args.apply,
                             debug=args.debug)
-    wilford_grimly.more_cowbell()
+    if args.plan:
+        wilford_grimly.plan(args.plan)
+    elif args.apply:
+        wilford_grimly.apply(args.apply, journal=args.journal,
+                             recheck=args.recheck)
+    else:
+        wilford_grimly.more_cowbell()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,120 @@
+'''Image retention policies for the reaper.
+'''
+import datetime
+from collections import namedtuple
+
+# A tag with everything a policy needs, parsed once up front.
+TagRecord = namedtuple('TagRecord', ['name', 'category', 'updated',
+                                     'digest'])
+
+
+def categorize_tag(tag):
+    '''Return the retention category for a tag, or None for tags (such as
+    releases, "recommended", and "latest*") that are never reaped.
+    '''
+    if tag.startswith('w'):
+        return "weekly"
+    if tag.startswith('d'):
+        return "daily"
+    if tag.startswith('exp'):
+        return "experimental"
+    return None
+
+
+class RetentionPolicy(object):
+    '''Base class for retention policies.  A policy is handed the records
+    for a single category, sorted newest first, and returns the set of
+    tag names that may be deleted.  Policies must be stateless so that
+    one instance can be reused for every run.
+    '''
+
+    def select_victims(self, records, now):
+        raise NotImplementedError()
+
+
+class CountPolicy(RetentionPolicy):
+    '''Keep the `keep` newest images.
+    '''
+
+    def __init__(self, keep):
+        if keep < 0:
+            raise ValueError("keep must be non-negative!")
+        self.keep = keep
+
+    def select_victims(self, records, now):
+        return set(r.name for r in records[self.keep:])
+
+    def __repr__(self):
+        return "CountPolicy(keep={})".format(self.keep)
+
+
+class AgePolicy(RetentionPolicy):
+    '''Keep images updated within `max_age` (a timedelta, or a number of
+    days).
+    '''
+
+    def __init__(self, max_age):
+        if not isinstance(max_age, datetime.timedelta):
+            max_age = datetime.timedelta(days=max_age)
+        self.max_age = max_age
+
+    def select_victims(self, records, now):
+        cutoff = now - self.max_age
+        return set(r.name for r in records if r.updated < cutoff)
+
+    def __repr__(self):
+        return "AgePolicy(max_age={})".format(self.max_age)
+
+
+class CombinedPolicy(RetentionPolicy):
+    '''Combine policies.  With require_all True (the default), an image is
+    deleted only if every policy would delete it: that is, anything any
+    policy wants to keep is kept.  With require_all False, an image is
+    deleted if any policy would delete it.
+    '''
+
+    def __init__(self, policies, require_all=True):
+        if not policies:
+            raise ValueError("CombinedPolicy requires policies!")
+        self.policies = list(policies)
+        self.require_all = require_all
+
+    def select_victims(self, records, now):
+        victim_sets = [p.select_victims(records, now)
+                       for p in self.policies]
+        if self.require_all:
+            return set.intersection(*victim_sets)
+        return set.union(*victim_sets)
+
+    def __repr__(self):
+        return "CombinedPolicy({}, require_all={})".format(
+            self.policies, self.require_all)
+
+
+class RetentionEngine(object):
+    '''Apply a policy per category to a collection of TagRecords.
+    `policies` maps category name to RetentionPolicy; records in a
+    category without a policy are always kept.
+    '''
+
+    def __init__(self, policies):
+        self.policies = dict(policies)
+
+    def select_victims(self, records, now=None):
+        '''Bucket the records by category in a single pass, order each
+        bucket once by its pre-parsed timestamp, and return the names of
+        all victims, oldest first.
+        '''
+        if now is None:
+            now = datetime.datetime.utcnow()
+        buckets = {}
+        for rec in records:
+            if rec.category in self.policies:
+                buckets.setdefault(rec.category, []).append(rec)
+        victims = []
+        for category, recs in buckets.items():
+            recs.sort(key=lambda r: r.updated, reverse=True)
+            chosen = self.policies[category].select_victims(recs, now)
+            victims.extend(r for r in recs if r.name in chosen)
+        victims.sort(key=lambda r: r.updated)
+        return [r.name for r in victims]
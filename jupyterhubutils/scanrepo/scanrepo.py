@@ -5,10 +5,12 @@ import logging
 import re
 import requests
 import semver
+import time
 import urllib.parse
 import urllib.request
 
 from eliot import start_action
+from ..metrics import Metrics
 from ..utils import make_logger
 
 
@@ -22,13 +24,14 @@ class ScanRepo(object):
                  experimentals=0, dailies=3, weeklies=2, releases=1,
                  recommended=True,
                  json=False, port=None,
-                 cachefile=None,
+                 cachefile=None, fetch_layers=False,
                  insecure=False, sort_field="name", debug=False):
         self.data = {}
         self._results = None
         self._results_map = {}
         self._name_to_manifest = {}
         self._all_tags = []
+        self.metrics = Metrics(prefix="jupyterhubutils_scanrepo")
         self.debug = debug
         self.logger = make_logger()
         if self.debug:
@@ -44,6 +47,8 @@ class ScanRepo(object):
         self.releases = releases
         self.recommended = recommended
         self.json = json
+        # If set, GET full manifests, not just digests, to learn layers.
+        self.fetch_layers = fetch_layers
         protocol = "https"
         self.insecure = insecure
         if self.insecure:
@@ -104,8 +109,9 @@ class ScanRepo(object):
         with start_action(action_type="_read_cachefile"):
             fn = self.cachefile
             try:
-                with open(fn) as f:
-                    data = json.load(f)
+                with self.metrics.timer("cachefile_read"):
+                    with open(fn) as f:
+                        data = json.load(f)
             except Exception as exc:
                 self.logger.error(
                     "Failed to load cachefile '{}'; must rescan".format(fn))
@@ -116,6 +122,7 @@ class ScanRepo(object):
             rm = self._results_map
             for tag in data.keys():
                 ihash = data[tag].get("hash")
+                layers = data[tag].get("layers")
                 updated = None
                 updatedstr = data[tag].get("updated")
                 if updatedstr:
@@ -123,6 +130,7 @@ class ScanRepo(object):
                 if ihash and updated:
                     if (tag not in nm or (nm[tag]["updated"] < updated)):
                         nm[tag] = {"hash": ihash,
+                                   "layers": layers,
                                    "updated": updated}
                     if tag not in rm:
                         rm[tag] = {"last_updated": updatedstr,
@@ -243,6 +251,9 @@ class ScanRepo(object):
                 if ihash and dstr:
                     modmap[k] = {"updated": dstr,
                                  "hash": ihash}
+                    layers = nm[k].get("layers")
+                    if layers:
+                        modmap[k]["layers"] = layers
             return json.dumps(modmap, sort_keys=True, indent=4)
 
     def _serialize_datetime(self, o):
@@ -280,6 +291,34 @@ class ScanRepo(object):
         with start_action(action_type="get_all_tags"):
             return self._all_tags
 
+    def get_metrics(self):
+        '''Return a snapshot of scanner instrumentation: per-phase wall
+        times, request and byte counts, manifest cache hit ratio, and
+        time since the last successful scan.
+        '''
+        snap = self.metrics.snapshot()
+        snap["gauges"].update(self._derived_metrics())
+        return snap
+
+    def get_prometheus_metrics(self):
+        '''Return scanner instrumentation in Prometheus text format.
+        '''
+        return self.metrics.to_prometheus(
+            extra_gauges=self._derived_metrics())
+
+    def _derived_metrics(self):
+        derived = {}
+        hits = self.metrics.get_counter("manifest_cache_hits")
+        misses = self.metrics.get_counter("manifest_cache_misses")
+        if hits + misses:
+            derived["manifest_cache_hit_ratio_overall"] = (
+                hits / (hits + misses))
+        last_ok = self.metrics.get_gauge("last_successful_scan_timestamp")
+        if last_ok:
+            derived["seconds_since_last_successful_scan"] = (
+                time.time() - last_ok)
+        return derived
+
     def _get_url(self, **kwargs):
         # Too noisy to log.
         params = None
@@ -303,15 +342,20 @@ class ScanRepo(object):
             results = []
             page = 1
             resp_bytes = None
+            scan_start = time.monotonic()
             while True:
                 try:
-                    resp_bytes = self._get_url(page=page)
+                    with self.metrics.timer("page_fetch"):
+                        resp_bytes = self._get_url(page=page)
                 except Exception as e:
+                    self.metrics.inc("scan_failures")
                     message = "Failure retrieving %s: %s" % (url, str(e))
                     if resp_bytes:
                         message += " [ data: %s ]" % (
                             str(resp_bytes.decode("utf-8")))
                     raise ValueError(message)
+                self.metrics.inc("pages_fetched")
+                self.metrics.inc("bytes_received", len(resp_bytes))
                 resp_text = resp_bytes.decode("utf-8")
                 try:
                     j = json.loads(resp_text)
@@ -322,10 +366,16 @@ class ScanRepo(object):
                 if "next" not in j or not j["next"]:
                     break
                 page = page + 1
+            self.metrics.observe("paging", time.monotonic() - scan_start)
             self._results = results
             self._update_results_map(results)
-            self._map_names_to_manifests()
+            with self.metrics.timer("manifests"):
+                self._map_names_to_manifests()
             self._reduce_results()
+            self.metrics.observe("scan", time.monotonic() - scan_start)
+            self.metrics.inc("scans")
+            self.metrics.set("tags", len(self._results_map))
+            self.metrics.set("last_successful_scan_timestamp", time.time())
 
     def _update_results_map(self, results):
         with start_action(action_type="_update_results_map"):
@@ -349,19 +399,29 @@ class ScanRepo(object):
                         "updated": tstamp,
                         "hash": None
                     }
-                if tstamp <= namemap[tag]["updated"] and namemap[tag]["hash"]:
+                have_layers = (namemap[tag].get("layers") or
+                               not self.fetch_layers)
+                if (tstamp <= namemap[tag]["updated"] and
+                        namemap[tag]["hash"] and have_layers):
                     # We have a manifest
                     # Update results map with hash
                     results[tag]["hash"] = namemap[tag]["hash"]
                     continue
                 self.logger.debug("Adding {} to check_names.".format(tag))
                 check_names.append(tag)
+            hits = len(results) - len(check_names)
+            self.metrics.inc("manifest_cache_hits", hits)
+            self.metrics.inc("manifest_cache_misses", len(check_names))
+            if results:
+                self.metrics.set("manifest_cache_hit_ratio",
+                                 hits / len(results))
             if not check_names:
                 self.logger.debug("All images have current hash.")
                 return
             baseurl = self.registry_url
             url = baseurl + "manifests/recommended"
             i_resp = requests.head(url)
+            self.metrics.inc("manifest_heads")
             authtok = None
             sc = i_resp.status_code
             if sc == 401:
@@ -380,7 +440,10 @@ class ScanRepo(object):
                         return None
                     endpoint = hd["realm"]
                     del hd["realm"]
-                    tresp = requests.get(endpoint, params=hd, json=True)
+                    with self.metrics.timer("token_fetch"):
+                        tresp = requests.get(endpoint, params=hd, json=True)
+                    self.metrics.inc("token_fetches")
+                    self.metrics.inc("bytes_received", len(tresp.content))
                     jresp = tresp.json()
                     authtok = jresp.get("token")
             elif sc != 200:
@@ -395,13 +458,24 @@ class ScanRepo(object):
             if authtok:
                 headers.update(
                     {"Authorization": "Bearer {}".format(authtok)})
+                head_start = time.monotonic()
                 for name in check_names:
-                    resp = requests.head(baseurl + "manifests/{}".format(
-                        name),
-                        headers=headers)
+                    murl = baseurl + "manifests/{}".format(name)
+                    if self.fetch_layers:
+                        resp = requests.get(murl, headers=headers)
+                        self.metrics.inc("manifest_gets")
+                        self.metrics.inc("bytes_received",
+                                         len(resp.content))
+                        namemap[name]["layers"] = self._extract_layers(
+                            resp)
+                    else:
+                        resp = requests.head(murl, headers=headers)
+                        self.metrics.inc("manifest_heads")
                     ihash = resp.headers["Docker-Content-Digest"]
                     namemap[name]["hash"] = ihash
                     results[name]["hash"] = ihash
+                self.metrics.observe("manifest_fetch",
+                                     time.monotonic() - head_start)
                 dstr = results[name]["last_updated"]
                 if dstr:
                     dt = self._convert_time(dstr)
@@ -416,12 +490,26 @@ class ScanRepo(object):
                         "Failed to write cache file: {}".format(exc))
                     # We're up to date.
 
+    def _extract_layers(self, resp):
+        # Return the list of layer digests, base layer first, from a v2
+        #  image manifest response.
+        try:
+            mfst = resp.json()
+        except ValueError:
+            self.logger.warning("Could not decode manifest as JSON.")
+            return None
+        layers = mfst.get("layers")
+        if not layers:
+            return None
+        return [x.get("digest") for x in layers]
+
     def _writecachefile(self):
         with start_action(action_type="_writecachefile"):
             if self.cachefile:
                 try:
-                    with open(self.cachefile, 'w') as f:
-                        f.write(self._namemap_to_json())
+                    with self.metrics.timer("cachefile_write"):
+                        with open(self.cachefile, 'w') as f:
+                            f.write(self._namemap_to_json())
                 except Exception as exc:
                     self.logger.error(
                         "Could not write to {}: {}".format(
@@ -465,9 +553,11 @@ class ScanRepo(object):
                 if manifest:
                     entry["updated"] = manifest.get("updated")
                     entry["hash"] = manifest.get("hash")
+                    entry["layers"] = manifest.get("layers")
                 else:
                     entry["updated"] = self._convert_time(res["last_updated"])
                     entry["hash"] = None
+                    entry["layers"] = None
             for res in reduced_results:
                 if (res.startswith("r") and not
                         res.startswith("recommended")):
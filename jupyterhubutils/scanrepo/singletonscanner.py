@@ -15,6 +15,14 @@ class SingletonScanner(ScanRepo, metaclass=Singleton):
         max_cache_age = kwargs.get('max_cache_age', 600)
         if max_cache_age is None:
             max_cache_age = 600
+        # If adaptive refresh is on, the cache age floats between
+        #  adaptive_min_age (near build windows) and adaptive_max_age
+        #  (the rest of the time).
+        adaptive_refresh = kwargs.pop('adaptive_refresh', False)
+        adaptive_min_age = kwargs.pop('adaptive_min_age', None)
+        adaptive_max_age = kwargs.pop('adaptive_max_age', None)
+        adaptive_history_days = kwargs.pop('adaptive_history_days', 28)
+        scan_on_init = kwargs.pop('scan_on_init', True)
         # Now remove them from kwargs before superclass init
         for karg in ['min_refresh_time', 'max_cache_age']:
             if karg in kwargs:
@@ -30,6 +38,26 @@ class SingletonScanner(ScanRepo, metaclass=Singleton):
             self.max_cache_age = max_cache_age
             self.logger.error("Nonsensical cache age/refresh time ratio.")
             self.logger.warning("Setting max_age to %ds." % max_cache_age)
+        self.adaptive_refresh = adaptive_refresh
+        if adaptive_min_age is None:
+            adaptive_min_age = min_refresh_time
+        if adaptive_min_age < min_refresh_time:
+            self.logger.warning(
+                "Adaptive minimum age below minimum refresh time.")
+            adaptive_min_age = min_refresh_time
+        if adaptive_max_age is None:
+            adaptive_max_age = 6 * max_cache_age
+        if adaptive_max_age < adaptive_min_age:
+            self.logger.error("Nonsensical adaptive cache age bounds.")
+            adaptive_max_age = adaptive_min_age
+        self.adaptive_min_age = adaptive_min_age
+        self.adaptive_max_age = adaptive_max_age
+        self.adaptive_history_days = adaptive_history_days
+        # Relative tag-arrival activity (0.0-1.0) per UTC hour of day
+        self._change_profile = None
+        if not scan_on_init:
+            self.logger.info("Not starting background scan.")
+            return
         thd = threading.Thread(target=self.scan)
         self.logger.info("Starting background scan.")
         thd.start()
@@ -74,11 +102,66 @@ class SingletonScanner(ScanRepo, metaclass=Singleton):
                 super().scan()
                 self.last_updated = now
                 self.scanning = False
+                if self.adaptive_refresh:
+                    self._update_change_profile()
+
+    def _update_change_profile(self):
+        '''Build a histogram, by UTC hour of day, of when tags within the
+        history window were last updated.  Each hour is smoothed with its
+        neighbors, so that we start scanning a little before a build
+        window opens, and normalized so the busiest hour is 1.0.
+        '''
+        with start_action(action_type="_update_change_profile"):
+            now = datetime.datetime.utcnow()
+            horizon = now - datetime.timedelta(
+                days=self.adaptive_history_days)
+            buckets = [0] * 24
+            for res in list(self._results_map.values()):
+                dstr = res.get("last_updated")
+                if not dstr:
+                    continue
+                try:
+                    updated = self._convert_time(dstr)
+                except ValueError:
+                    continue
+                if updated < horizon:
+                    continue
+                buckets[updated.hour] += 1
+            smoothed = [buckets[h] +
+                        0.5 * (buckets[(h - 1) % 24] + buckets[(h + 1) % 24])
+                        for h in range(24)]
+            peak = max(smoothed)
+            if not peak:
+                self.logger.debug("No recent tag changes to learn from.")
+                self._change_profile = None
+                return
+            self._change_profile = [x / peak for x in smoothed]
+            self.logger.debug(
+                "Tag change profile by hour: {}".format(
+                    ["{:.2f}".format(x) for x in self._change_profile]))
+
+    def get_refresh_interval(self, now=None):
+        '''Return the maximum cache age, in seconds, to apply at `now`.
+        Without adaptive refresh (or before we have any history), that is
+        just max_cache_age.  Otherwise it is interpolated between
+        adaptive_max_age (quiet hours) and adaptive_min_age (the busiest
+        hour for new tags).
+        '''
+        profile = self._change_profile
+        if not self.adaptive_refresh or not profile:
+            return self.max_cache_age
+        if now is None:
+            now = datetime.datetime.utcnow()
+        activity = profile[now.hour]
+        lo = self.adaptive_min_age
+        hi = self.adaptive_max_age
+        return int(hi - (hi - lo) * activity)
 
     def _scan_if_needed(self):
         with start_action(action_type="_scan_if_needed"):
             now = datetime.datetime.utcnow()
-            max_age = datetime.timedelta(seconds=self.max_cache_age)
+            max_age = datetime.timedelta(
+                seconds=self.get_refresh_interval(now))
             last_updated = self.last_updated
             if ((now - last_updated) > max_age):
                 self.logger.info("Scan data has expired.")
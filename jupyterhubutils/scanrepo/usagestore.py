@@ -0,0 +1,121 @@
+'''A small file-backed record of which images users actually spawn.
+'''
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import time
+from eliot import start_action
+from ..utils import make_logger
+
+
+def normalize_image(img):
+    '''Reduce an image reference to "owner/name:tag" (or
+    "owner/name@digest"), dropping any registry host, so that the
+    spawner's and the prepuller's spellings of an image compare equal.
+    '''
+    if '@' in img:
+        repo, sep, ref = img.partition('@')
+    else:
+        repo, sep, ref = img, ':', 'latest'
+        colon = img.rfind(':')
+        if colon > img.rfind('/'):
+            repo, ref = img[:colon], img[(colon + 1):]
+    parts = repo.split('/')
+    if len(parts) > 1 and ('.' in parts[0] or ':' in parts[0] or
+                           parts[0] == 'localhost'):
+        parts = parts[1:]
+    if len(parts) == 1:
+        parts = ['library'] + parts
+    return '/'.join(parts) + sep + ref
+
+
+class UsageStore(object):
+    '''Record image selections in a JSON file, and score images by recent
+    use.  Each use counts for 1.0 when new, halving every `half_life`
+    days; uses older than `max_age` days are dropped.  Writers take an
+    exclusive lock and replace the file atomically, so the hub and the
+    prepuller may share it.
+    '''
+
+    def __init__(self, path, half_life=7.0, max_age=30.0, max_uses=1000,
+                 debug=False):
+        self.logger = make_logger()
+        if debug:
+            self.logger.setLevel(logging.DEBUG)
+        if not path:
+            raise ValueError("path must be set!")
+        self.path = path
+        self.half_life = half_life
+        self.max_age = max_age
+        # Cap per-image history so a busy image can't bloat the file.
+        self.max_uses = max_uses
+
+    def record(self, image, when=None):
+        '''Record one use of `image` at `when` (default now, in seconds
+        since the epoch).
+        '''
+        with start_action(action_type="usagestore_record"):
+            if when is None:
+                when = time.time()
+            key = normalize_image(image)
+            with open(self.path + ".lock", "a") as lockf:
+                fcntl.flock(lockf, fcntl.LOCK_EX)
+                try:
+                    uses = self._read()
+                    history = uses.setdefault(key, [])
+                    history.append(when)
+                    if len(history) > self.max_uses:
+                        del history[:-self.max_uses]
+                    self._write(self._prune(uses, time.time()))
+                finally:
+                    fcntl.flock(lockf, fcntl.LOCK_UN)
+            self.logger.debug("Recorded use of '{}'".format(key))
+
+    def scores(self, now=None):
+        '''Return a dict mapping normalized image names to their decayed
+        usage scores.
+        '''
+        with start_action(action_type="usagestore_scores"):
+            if now is None:
+                now = time.time()
+            uses = self._prune(self._read(), now)
+            scores = {}
+            for key, history in uses.items():
+                scores[key] = sum(
+                    [0.5 ** ((now - x) / (86400.0 * self.half_life))
+                     for x in history])
+            return scores
+
+    def _prune(self, uses, now):
+        horizon = now - 86400.0 * self.max_age
+        pruned = {}
+        for key, history in uses.items():
+            recent = [x for x in history if x >= horizon]
+            if recent:
+                pruned[key] = recent
+        return pruned
+
+    def _read(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as exc:
+            self.logger.warning(
+                "Could not read usage file '{}': {}".format(self.path, exc))
+            return {}
+        return data.get("images", {})
+
+    def _write(self, uses):
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        fd, tmpname = tempfile.mkstemp(dir=dirname, prefix=".usage-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"images": uses}, f, sort_keys=True)
+            os.replace(tmpname, self.path)
+        except Exception:
+            os.unlink(tmpname)
+            raise
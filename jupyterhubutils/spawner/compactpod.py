@@ -0,0 +1,265 @@
+'''Compact stand-ins for Kubernetes pod and event objects, holding only
+the fields the spawner reads, for use in the reflectors' stores.
+
+They keep the attribute layout of the `V1Pod` and `V1Event` models
+(`pod.status.phase`, `pod.metadata.uid`, and so on), so code written
+against full objects works unchanged on the subset of fields they carry.
+They can be built either from model objects or straight from the API
+server's JSON.
+'''
+import datetime
+
+
+def parse_time(tstr):
+    '''Turn a Kubernetes timestamp ("2020-01-02T03:04:05Z", possibly with
+    fractional seconds) into an aware UTC datetime, as the client models
+    do.  None stays None.
+    '''
+    if not tstr:
+        return None
+    tstr = tstr.rstrip('Z')
+    fmt = "%Y-%m-%dT%H:%M:%S"
+    if '.' in tstr:
+        fmt += ".%f"
+        whole, frac = tstr.split('.', 1)
+        tstr = whole + '.' + frac[:6]
+    return datetime.datetime.strptime(tstr, fmt).replace(
+        tzinfo=datetime.timezone.utc)
+
+
+def format_time(dt):
+    '''Turn an aware UTC datetime back into a Kubernetes timestamp, the
+    inverse of `parse_time`.  None stays None.
+    '''
+    if dt is None:
+        return None
+    tstr = dt.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+    if dt.microsecond:
+        tstr += ".%06d" % dt.microsecond
+    return tstr + 'Z'
+
+
+class CompactTerminated(object):
+    __slots__ = ['exit_code']
+
+    def __init__(self, exit_code=None):
+        self.exit_code = exit_code
+
+
+class CompactContainerState(object):
+    __slots__ = ['terminated']
+
+    def __init__(self, terminated=None):
+        self.terminated = terminated
+
+
+class CompactContainerStatus(object):
+    __slots__ = ['name', 'ready', 'state']
+
+    def __init__(self, name=None, ready=False, state=None):
+        self.name = name
+        self.ready = ready
+        self.state = state or CompactContainerState()
+
+
+class CompactPodStatus(object):
+    __slots__ = ['phase', 'pod_ip', 'container_statuses']
+
+    def __init__(self, phase=None, pod_ip=None, container_statuses=None):
+        self.phase = phase
+        self.pod_ip = pod_ip
+        self.container_statuses = container_statuses
+
+
+class CompactPodSpec(object):
+    __slots__ = ['node_name']
+
+    def __init__(self, node_name=None):
+        self.node_name = node_name
+
+
+class CompactObjectMeta(object):
+    __slots__ = ['name', 'namespace', 'uid', 'labels', 'resource_version',
+                 'creation_timestamp', 'deletion_timestamp']
+
+    def __init__(self, name=None, namespace=None, uid=None, labels=None,
+                 resource_version=None, creation_timestamp=None,
+                 deletion_timestamp=None):
+        self.name = name
+        self.namespace = namespace
+        self.uid = uid
+        self.labels = labels
+        self.resource_version = resource_version
+        self.creation_timestamp = creation_timestamp
+        self.deletion_timestamp = deletion_timestamp
+
+
+class CompactPod(object):
+    '''A pod reduced to its metadata identity and labels, node, phase, IP,
+    and container readiness and exit codes.
+    '''
+    __slots__ = ['metadata', 'spec', 'status']
+
+    def __init__(self, metadata=None, spec=None, status=None):
+        self.metadata = metadata or CompactObjectMeta()
+        self.spec = spec or CompactPodSpec()
+        self.status = status or CompactPodStatus()
+
+    @classmethod
+    def from_pod(cls, pod):
+        '''Build a compact record from a `V1Pod`.
+        '''
+        md = pod.metadata
+        meta = CompactObjectMeta(
+            name=md.name,
+            namespace=md.namespace,
+            uid=md.uid,
+            labels=md.labels,
+            resource_version=md.resource_version,
+            creation_timestamp=md.creation_timestamp,
+            deletion_timestamp=md.deletion_timestamp)
+        spec = CompactPodSpec()
+        if pod.spec:
+            spec.node_name = pod.spec.node_name
+        status = CompactPodStatus()
+        if pod.status:
+            status.phase = pod.status.phase
+            status.pod_ip = pod.status.pod_ip
+            if pod.status.container_statuses is not None:
+                status.container_statuses = []
+                for cst in pod.status.container_statuses:
+                    term = None
+                    if cst.state and cst.state.terminated:
+                        term = CompactTerminated(
+                            exit_code=cst.state.terminated.exit_code)
+                    status.container_statuses.append(
+                        CompactContainerStatus(
+                            name=cst.name,
+                            ready=cst.ready,
+                            state=CompactContainerState(terminated=term)))
+        return cls(metadata=meta, spec=spec, status=status)
+
+    @classmethod
+    def from_dict(cls, obj):
+        '''Build a compact record from a pod's JSON representation (as a
+        dict, with the API's camelCase keys).
+        '''
+        md = obj.get('metadata') or {}
+        meta = CompactObjectMeta(
+            name=md.get('name'),
+            namespace=md.get('namespace'),
+            uid=md.get('uid'),
+            labels=md.get('labels'),
+            resource_version=md.get('resourceVersion'),
+            creation_timestamp=parse_time(md.get('creationTimestamp')),
+            deletion_timestamp=parse_time(md.get('deletionTimestamp')))
+        spec = CompactPodSpec(
+            node_name=(obj.get('spec') or {}).get('nodeName'))
+        st = obj.get('status') or {}
+        status = CompactPodStatus(phase=st.get('phase'),
+                                  pod_ip=st.get('podIP'))
+        if 'containerStatuses' in st:
+            status.container_statuses = []
+            for cst in st['containerStatuses'] or []:
+                term = None
+                tstate = (cst.get('state') or {}).get('terminated')
+                if tstate:
+                    term = CompactTerminated(
+                        exit_code=tstate.get('exitCode'))
+                status.container_statuses.append(
+                    CompactContainerStatus(
+                        name=cst.get('name'),
+                        ready=cst.get('ready', False),
+                        state=CompactContainerState(terminated=term)))
+        return cls(metadata=meta, spec=spec, status=status)
+
+
+class CompactObjectReference(object):
+    __slots__ = ['kind', 'name', 'namespace', 'uid']
+
+    def __init__(self, kind=None, name=None, namespace=None, uid=None):
+        self.kind = kind
+        self.name = name
+        self.namespace = namespace
+        self.uid = uid
+
+
+class CompactEvent(object):
+    '''An event reduced to what spawn progress reporting reads: identity,
+    the object it is about, its reason, message and type, and its
+    timestamps.
+    '''
+    __slots__ = ['metadata', 'involved_object', 'reason', 'message',
+                 'type', 'count', 'first_timestamp', 'last_timestamp',
+                 'event_time']
+
+    def __init__(self, metadata=None, involved_object=None, reason=None,
+                 message=None, type=None, count=None, first_timestamp=None,
+                 last_timestamp=None, event_time=None):
+        self.metadata = metadata or CompactObjectMeta()
+        self.involved_object = involved_object or CompactObjectReference()
+        self.reason = reason
+        self.message = message
+        self.type = type
+        self.count = count
+        self.first_timestamp = first_timestamp
+        self.last_timestamp = last_timestamp
+        self.event_time = event_time
+
+    @classmethod
+    def from_dict(cls, obj):
+        '''Build a compact record from an event's JSON representation.
+        '''
+        md = obj.get('metadata') or {}
+        meta = CompactObjectMeta(
+            name=md.get('name'),
+            namespace=md.get('namespace'),
+            uid=md.get('uid'),
+            resource_version=md.get('resourceVersion'),
+            creation_timestamp=parse_time(md.get('creationTimestamp')))
+        io = obj.get('involvedObject') or {}
+        ref = CompactObjectReference(kind=io.get('kind'),
+                                     name=io.get('name'),
+                                     namespace=io.get('namespace'),
+                                     uid=io.get('uid'))
+        return cls(metadata=meta,
+                   involved_object=ref,
+                   reason=obj.get('reason'),
+                   message=obj.get('message'),
+                   type=obj.get('type'),
+                   count=obj.get('count'),
+                   first_timestamp=parse_time(obj.get('firstTimestamp')),
+                   last_timestamp=parse_time(obj.get('lastTimestamp')),
+                   event_time=parse_time(obj.get('eventTime')))
+
+    def to_dict(self):
+        '''Return the event as the API server's JSON representation (with
+        camelCase keys and string timestamps) of the fields we hold, so
+        that it can be serialized as spawn progress.
+        '''
+        md = self.metadata
+        io = self.involved_object
+        obj = {
+            'metadata': {
+                'name': md.name,
+                'namespace': md.namespace,
+                'uid': md.uid,
+                'resourceVersion': md.resource_version,
+                'creationTimestamp': format_time(md.creation_timestamp)},
+            'involvedObject': {
+                'kind': io.kind,
+                'name': io.name,
+                'namespace': io.namespace,
+                'uid': io.uid},
+            'reason': self.reason,
+            'message': self.message,
+            'type': self.type,
+            'count': self.count,
+            'firstTimestamp': format_time(self.first_timestamp),
+            'lastTimestamp': format_time(self.last_timestamp),
+            'eventTime': format_time(self.event_time)}
+        # Like the API server, leave out fields that are not set.
+        for sub in (obj['metadata'], obj['involvedObject'], obj):
+            for key in [k for k, v in sub.items() if v is None]:
+                del sub[key]
+        return obj
@@ -5,6 +5,7 @@ import json
 from .. import LSSTMiddleManager
 from ..config import LSSTConfig
 from .multispawner import MultiNamespacedKubeSpawner
+from ..scanrepo.usagestore import UsageStore
 from eliot import start_action
 from kubespawner.objects import make_pod
 from tornado import gen
@@ -141,6 +142,21 @@ class LSSTSpawner(MultiNamespacedKubeSpawner):
         form = yield self.asynchronize(om.get_options_form)
         return form
 
+    def _reflector_scope(self, key):
+        # This runs from the superclass constructor, before we have an
+        #  LSST manager, so go straight to the config.
+        #  The event reflector already lists a single namespace, so only
+        #  the cluster-wide pod reflector needs scoping.
+        cfg = LSSTConfig()
+        if (key != "pods" or not cfg.scope_reflectors or
+                not cfg.instance_name):
+            return {}
+        return {
+            'namespace_prefix': "{}-".format(self._namespace_default()),
+            'instance_label_selector': "lsst.io/instance={}".format(
+                cfg.instance_name),
+        }
+
     def set_user_namespace(self):
         '''Get namespace and store it here (for spawning) and in
         namespace_mgr.'''
@@ -259,6 +275,9 @@ class LSSTSpawner(MultiNamespacedKubeSpawner):
         nm = self.lsst_mgr.namespace_mgr
         vm = self.lsst_mgr.volume_mgr
         om = self.lsst_mgr.optionsform_mgr
+        if cfg.instance_name:
+            # Lets the reflectors watch only this instance's pods.
+            labels['lsst.io/instance'] = cfg.instance_name
         # Get the standard env and then update it with the environment
         # from our environment manager, except that we want the tokens from
         # the standard env
@@ -347,6 +366,11 @@ class LSSTSpawner(MultiNamespacedKubeSpawner):
             self.image = image
             pod_env['JUPYTER_IMAGE_SPEC'] = image
             pod_env['JUPYTER_IMAGE'] = image
+        if cfg.image_usage_file:
+            # File locking and I/O; keep it off the event loop, and don't
+            #  wait for it.
+            self.asynchronize(self._record_image_usage,
+                              cfg.image_usage_file, image)
         # Set flag to clear .local if indicated
         clear_dotlocal = self.user_options.get('clear_dotlocal')
         if clear_dotlocal:
@@ -473,6 +497,15 @@ class LSSTSpawner(MultiNamespacedKubeSpawner):
         )
         return pod
 
+    def _record_image_usage(self, usage_file, image):
+        # Runs in the executor.  Usage feeds prepull ordering; it must
+        #  never block or break a spawn.
+        try:
+            UsageStore(usage_file).record(image)
+        except Exception as exc:
+            self.log.warning(
+                "Could not record use of image '{}': {}".format(image, exc))
+
     def dump(self):
         '''Return dict representation suitable for pretty-printing.'''
         sd = {"namespace": self.namespace,
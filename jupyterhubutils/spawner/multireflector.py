@@ -1,16 +1,87 @@
 # Inspired by, and based on, Adam Tilghman's Multi-Namespace work in
 #  https://github.com/jupyterhub/kubespawner/pull/218
+import asyncio
+import bisect
+import datetime
+import heapq
+import json
 import threading
 import time
+from types import SimpleNamespace
 from eliot import start_action
 from kubernetes import watch
+from kubernetes.client.rest import ApiException
 from kubespawner.reflector import NamespacedResourceReflector
-from traitlets import Bool
+from .compactpod import CompactPod, CompactEvent
+from ..metrics import Metrics
+from traitlets import Bool, Int, Unicode
+try:
+    # Much faster than the standard library for big watch streams.
+    import ujson as fastjson
+except ImportError:
+    fastjson = json
 # This is kubernetes client implementation specific, but we need to know
 # whether it was a network or watch timeout.
 from urllib3.exceptions import ReadTimeoutError
 
 
+class ModelWatch(watch.Watch):
+    """A watch that deserializes events' objects into model objects, except
+    for ERROR and BOOKMARK events, whose objects are always left as plain
+    dicts.  Depending on the client version, the stock watch turns an
+    error status into an empty model of the watched kind (losing its
+    code), fails validation on bookmarks for some kinds, or hands
+    bookmarks back as dicts.
+
+    `gone` is set if the API server said our resource version has expired
+    (410), even if the client then swallows that and just ends the stream,
+    as clients 12 through 16 do when `timeout_seconds` is set.
+    """
+
+    gone = False
+
+    def _note_status(self, js, obj):
+        if (js.get('type') == 'ERROR' and isinstance(obj, dict) and
+                obj.get('code') == 410):
+            self.gone = True
+
+    def unmarshal_event(self, data, return_type):
+        js = json.loads(data)
+        obj = js.get('object')
+        js['raw_object'] = obj
+        self._note_status(js, obj)
+        if not isinstance(obj, dict) or js.get('type') == 'ERROR':
+            return js
+        if js.get('type') == 'BOOKMARK' or not return_type:
+            rv = (obj.get('metadata') or {}).get('resourceVersion')
+            if rv:
+                self.resource_version = rv
+            return js
+        js['object'] = self._api_client.deserialize(
+            SimpleNamespace(data=json.dumps(obj)), return_type)
+        md = getattr(js['object'], 'metadata', None)
+        if md is not None and md.resource_version:
+            self.resource_version = md.resource_version
+        return js
+
+
+class RawWatch(ModelWatch):
+    """A watch that hands back events' objects as plain dicts parsed from
+    the raw JSON, rather than deserializing them into model objects.
+    """
+
+    def unmarshal_event(self, data, return_type):
+        js = fastjson.loads(data)
+        obj = js.get('object')
+        self._note_status(js, obj)
+        if isinstance(obj, dict) and js.get('type') != 'ERROR':
+            rv = (obj.get('metadata') or {}).get('resourceVersion')
+            if rv:
+                self.resource_version = rv
+        js['raw_object'] = obj
+        return js
+
+
 class MultiNamespaceResourceReflector(NamespacedResourceReflector):
     list_method_omit_namespace = Bool(
         False,
@@ -21,6 +92,78 @@ class MultiNamespaceResourceReflector(NamespacedResourceReflector):
         """
     )
 
+    watch_bookmarks = Bool(
+        True,
+        config=True,
+        help="""
+        If True, ask the API server for bookmark events, which advance our
+        resource version during quiet periods, so that a restarted watch
+        is less likely to have to fall back to a full relist.  (Needs
+        kubernetes client 11 or later.)
+        """
+    )
+
+    list_chunk_size = Int(
+        500,
+        config=True,
+        help="""
+        Fetch at most this many resources per request when doing a full
+        list, following `continue` tokens for the rest.  0 fetches
+        everything in a single request.
+        """
+    )
+
+    raw_json = Bool(
+        False,
+        config=True,
+        help="""
+        If True, skip the kubernetes client's model deserialization: read
+        list and watch responses as raw JSON and build compact records
+        holding only the fields the spawner uses straight from that.
+        Install `ujson` for the fastest parsing.
+        """
+    )
+
+    instance_label_selector = Unicode(
+        '',
+        config=True,
+        help="""
+        Extra label selector terms (for instance,
+        "lsst.io/instance=mine") to add to the reflector's selector, so
+        that the API server only sends us this instance's resources.
+        """
+    )
+
+    namespace_prefix = Unicode(
+        '',
+        config=True,
+        help="""
+        If set, and the reflector lists across all namespaces, ignore
+        resources in namespaces whose names do not start with this
+        prefix.  (The API server cannot filter by namespace prefix, so
+        this is done as events arrive, before any further processing.)
+        """
+    )
+
+    # The last resource version we have seen; watches resume from here.
+    resource_version = None
+
+    # Secondary indexes to maintain over the store: index name to a
+    #  function mapping a stored record to its index value (or None).
+    indexers = {}
+
+    def __init__(self, *args, **kwargs):
+        # The superclass constructor starts the reflector, so the store
+        #  bookkeeping must exist before we call it.
+        self._store_lock = threading.Lock()
+        self._indexes = {}
+        self._index_values = {}
+        # Key to list of (event loop, future) awaiting a change to it
+        self._waiters = {}
+        self.metrics = Metrics(
+            prefix="jupyterhubutils_reflector_{}".format(self.kind))
+        super().__init__(*args, **kwargs)
+
     def _start_watching_pods(self, replace=False):
         """Start the pod reflector
 
@@ -40,10 +183,231 @@ class MultiNamespaceResourceReflector(NamespacedResourceReflector):
         """
         return resource.metadata.name
 
+    def _wanted(self, resource):
+        """Return False for resources outside our namespace prefix.
+        """
+        if not self.namespace_prefix or not self.list_method_omit_namespace:
+            return True
+        namespace = resource.metadata.namespace or ''
+        return namespace.startswith(self.namespace_prefix)
+
+    def _make_record(self, resource):
+        """Return what to keep in the store for a resource; subclasses may
+        override to keep something smaller than the full object.
+        """
+        return resource
+
+    def _index_entries(self, record):
+        values = {}
+        for name, func in self.indexers.items():
+            value = func(record)
+            if value is not None:
+                values[name] = value
+        return values
+
+    def _store_put(self, key, record):
+        """Add or replace a record in the store, keeping indexes current.
+        """
+        with self._store_lock:
+            self._unindex(key)
+            self.resources[key] = record
+            values = self._index_entries(record)
+            self._index_values[key] = values
+            for name, value in values.items():
+                self._indexes.setdefault(name, {}).setdefault(
+                    value, set()).add(key)
+        self._notify([key])
+
+    def _store_remove(self, key):
+        """Remove a record from the store, if present, and its index
+        entries.
+        """
+        with self._store_lock:
+            self._unindex(key)
+            self.resources.pop(key, None)
+        self._notify([key])
+
+    def _store_replace(self, resources):
+        """Swap in a whole new store (from a full list), with freshly
+        built indexes.
+        """
+        indexes = {}
+        index_values = {}
+        for key, record in resources.items():
+            values = self._index_entries(record)
+            index_values[key] = values
+            for name, value in values.items():
+                indexes.setdefault(name, {}).setdefault(
+                    value, set()).add(key)
+        with self._store_lock:
+            # This is an atomic operation on the dictionary!
+            self.resources = resources
+            self._indexes = indexes
+            self._index_values = index_values
+        # Anything might have changed.
+        self._notify(None)
+
+    def _unindex(self, key):
+        # Caller holds _store_lock.
+        for name, value in self._index_values.pop(key, {}).items():
+            keys = self._indexes.get(name, {}).get(value)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._indexes[name][value]
+
+    def _notify(self, keys):
+        # Wake whoever is awaiting a change to any of `keys` (all keys, if
+        #  None).  We are usually on the watch thread, so the futures are
+        #  resolved on their own loops.
+        with self._store_lock:
+            if keys is None:
+                keys = list(self._waiters.keys())
+            waiters = []
+            for key in keys:
+                waiters.extend(self._waiters.pop(key, []))
+        for loop, fut in waiters:
+            try:
+                loop.call_soon_threadsafe(self._resolve, fut)
+            except RuntimeError:
+                # Loop is closed; nobody is waiting any more.
+                pass
+
+    @staticmethod
+    def _resolve(fut):
+        if not fut.done():
+            fut.set_result(None)
+
+    async def wait_for(self, key, predicate, timeout=None,
+                       fail_message=None):
+        """Wait, on the running event loop, until `predicate` is true of
+        the record stored under `key` (None if there is none), and return
+        that record.  We are woken by the watch thread as soon as the
+        key changes, rather than polling.  Raise TimeoutError if
+        `timeout` seconds pass first, or as soon as the reflector is
+        stopped, since it will see no more changes.
+        """
+        loop = asyncio.get_event_loop()
+        deadline = None
+        if timeout is not None:
+            deadline = loop.time() + timeout
+        while True:
+            with self._store_lock:
+                record = self.resources.get(key)
+                if predicate(record):
+                    return record
+                if self._stop_event.is_set():
+                    raise TimeoutError(
+                        "%s reflector stopped while waiting for %r" % (
+                            self.kind, key))
+                fut = loop.create_future()
+                self._waiters.setdefault(key, []).append((loop, fut))
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - loop.time()
+            try:
+                if remaining is not None and remaining <= 0:
+                    raise asyncio.TimeoutError()
+                await asyncio.wait_for(fut, remaining)
+            except asyncio.TimeoutError:
+                with self._store_lock:
+                    waiters = self._waiters.get(key, [])
+                    if (loop, fut) in waiters:
+                        waiters.remove((loop, fut))
+                    if not waiters:
+                        self._waiters.pop(key, None)
+                raise TimeoutError(
+                    fail_message or "Timed out waiting for %r" % (key,))
+
+    def stop(self):
+        super().stop()
+        # Wake everyone waiting on us, so that they can give up (and,
+        #  if we are being replaced, wait on our replacement instead).
+        self._notify(None)
+
+    def by_index(self, name, value):
+        """Return the records whose `name` index value is `value`, without
+        scanning the store.
+        """
+        with self._store_lock:
+            keys = list(self._indexes.get(name, {}).get(value, ()))
+            return [self.resources[k] for k in keys if k in self.resources]
+
+    def index_values(self, name):
+        """Return the distinct values currently present in an index.
+        """
+        with self._store_lock:
+            return list(self._indexes.get(name, {}).keys())
+
+    def get_metrics(self):
+        """Return a snapshot of reflector health: relists, watch
+        restarts, errors and backoff sleeps, list and backoff times, watch
+        lag, store size, and time since the last watch event.
+        """
+        snap = self.metrics.snapshot()
+        snap["gauges"].update(self._derived_metrics())
+        return snap
+
+    def get_prometheus_metrics(self):
+        """Return reflector health in Prometheus text format.
+        """
+        return self.metrics.to_prometheus(
+            extra_gauges=self._derived_metrics())
+
+    def _derived_metrics(self):
+        derived = {"store_size": len(self.resources)}
+        last = self.metrics.get_gauge("last_event_timestamp")
+        if last:
+            derived["seconds_since_last_event"] = time.time() - last
+        return derived
+
+    def _event_time(self, ev_type, resource):
+        """Return when the change a watch event reports happened, if we
+        can tell (None otherwise), for measuring watch lag.  Only a
+        newly-added resource carries that, as its creation time.
+        """
+        if ev_type != 'ADDED':
+            return None
+        return getattr(resource.metadata, 'creation_timestamp', None)
+
+    def _observe_lag(self, ev_type, resource):
+        when = self._event_time(ev_type, resource)
+        if when is None:
+            return
+        lag = (datetime.datetime.now(datetime.timezone.utc) -
+               when).total_seconds()
+        # Clock skew between us and the API server can make this negative.
+        lag = max(lag, 0.0)
+        self.metrics.observe("watch_lag", lag)
+
+    def _record_from_dict(self, obj):
+        """Build a compact record from a resource's JSON representation,
+        for `raw_json` mode.
+        """
+        raise NotImplementedError(
+            "%s does not support raw_json" % self.__class__.__name__)
+
+    def _list_page(self, list_method, list_args):
+        # Return one page of a list as (resources, continue token,
+        #  resource version).
+        if not self.raw_json:
+            page = list_method(**list_args)
+            return (page.items, page.metadata._continue,
+                    page.metadata.resource_version)
+        resp = list_method(_preload_content=False, **list_args)
+        data = fastjson.loads(resp.data)
+        md = data.get('metadata') or {}
+        return ([self._record_from_dict(x) for x in data.get('items') or []],
+                md.get('continue'), md.get('resourceVersion'))
+
     def _list_and_update(self):
         """
         Update current list of resources by doing a full fetch.
         Overwrites all current resource info.
+
+        The fetch is done in chunks of `list_chunk_size`, and the new
+        store is built up on the side and swapped in once complete, so
+        readers never see a partial list.
         """
         # Way too spammy to log with eliot.
         list_args = {
@@ -54,15 +418,44 @@ class MultiNamespaceResourceReflector(NamespacedResourceReflector):
 
         if not self.list_method_omit_namespace:
             list_args['namespace'] = self.namespace
+        if self.list_chunk_size:
+            list_args['limit'] = self.list_chunk_size
 
-        initial_resources = getattr(
-            self.api, self.list_method_name)(**list_args)
+        list_method = getattr(self.api, self.list_method_name)
+        resources = {}
+        self.metrics.inc("relists")
+        list_start = time.monotonic()
+        while True:
+            try:
+                items, cont, resource_version = self._list_page(
+                    list_method, list_args)
+            except ApiException as exc:
+                if exc.status != 410 or '_continue' not in list_args:
+                    raise
+                # The continue token expired; start the list over.
+                self.log.debug("List continuation expired; restarting.")
+                self.metrics.inc("list_continue_expired")
+                list_args.pop('_continue')
+                resources = {}
+                continue
+            for p in items:
+                if not self._wanted(p):
+                    continue
+                resources[self._create_resource_key(p)] = \
+                    self._make_record(p)
+            if not cont:
+                break
+            list_args['_continue'] = cont
 
-        # This is an atomic operation on the dictionary!
-        self.resources = {self._create_resource_key(
-            p): p for p in initial_resources.items}
+        self._store_replace(resources)
+        self.metrics.observe("list", time.monotonic() - list_start)
         # return the resource version so we can hook up a watch
-        return initial_resources.metadata.resource_version
+        return resource_version
+
+    def _make_watch(self):
+        if self.raw_json:
+            return RawWatch()
+        return ModelWatch()
 
     def _watch_and_update(self):
         """
@@ -73,12 +466,15 @@ class MultiNamespaceResourceReflector(NamespacedResourceReflector):
         We first fetch the list of current resources, and store that. Then we
         register to be notified of changes to those resources, and keep our
         local store up-to-date based on these notifications.
+        We remember the resource version of the last event (or bookmark)
+        we saw, and restart watches from there, whether they ended by
+        timing out or on an error.  Only when the API server tells us
+        that version is gone (410) do we do a full fetch again, whether
+        the client raises that, hands it to us as an ERROR event, or
+        swallows it and just ends the stream.
         We also perform exponential backoff, giving up after we hit 32s
         wait time. This should protect against network connections dropping
-        and intermittent unavailability of the api-server. Every time we
-        recover from an exception we also do a full fetch, to pick up
-        changes that might've been missed in the time we were not doing
-        a watch.
+        and intermittent unavailability of the api-server.
 
         Note that we're playing a bit with fire here, by updating a dictionary
         in this thread while it is probably being read in another thread
@@ -93,19 +489,26 @@ class MultiNamespaceResourceReflector(NamespacedResourceReflector):
             if self.field_selector:
                 selectors.append("field selector=%r" % self.field_selector)
             cur_delay = 0.1
+            first = True
             while True:
+                if not first:
+                    self.metrics.inc("watch_restarts")
+                first = False
                 start = time.monotonic()
-                w = watch.Watch()
+                w = self._make_watch()
                 try:
-                    resource_version = self._list_and_update()
+                    if self.resource_version is None:
+                        self.resource_version = self._list_and_update()
                     if not self.first_load_future.done():
                         # signal that we've loaded our initial data
                         self.first_load_future.set_result(None)
-                        watch_args = {
-                            'label_selector': self.label_selector,
-                            'field_selector': self.field_selector,
-                            'resource_version': resource_version,
-                        }
+                    watch_args = {
+                        'label_selector': self.label_selector,
+                        'field_selector': self.field_selector,
+                        'resource_version': self.resource_version,
+                    }
+                    if self.watch_bookmarks:
+                        watch_args['allow_watch_bookmarks'] = True
                     if not self.list_method_omit_namespace:
                         watch_args['namespace'] = self.namespace
                     if self.request_timeout:
@@ -122,47 +525,98 @@ class MultiNamespaceResourceReflector(NamespacedResourceReflector):
                             **watch_args
                     ):
                         cur_delay = 0.1
+                        self.metrics.inc("watch_events")
+                        self.metrics.set("last_event_timestamp", time.time())
+                        if ev['type'] in ('ERROR', 'BOOKMARK'):
+                            # Whatever the client made of the object,
+                            #  the raw one is the status or bookmark.
+                            self._watch_status(ev['type'],
+                                               ev.get('raw_object'))
+                            continue
                         resource = ev['object']
+                        if self.raw_json:
+                            resource = self._record_from_dict(resource)
+                        self.resource_version = (
+                            resource.metadata.resource_version or
+                            self.resource_version)
+                        if not self._wanted(resource):
+                            continue
+                        self._observe_lag(ev['type'], resource)
                         if ev['type'] == 'DELETED':
-                            # This is an atomic delete operation on the
-                            # dictionary!
-                            self.resources.pop(
-                                self._create_resource_key(resource), None)
+                            self._store_remove(
+                                self._create_resource_key(resource))
                         else:
-                            # This is an atomic operation on the dictionary!
-                            self.resources[self._create_resource_key(
-                                resource)] = resource
+                            self._store_put(
+                                self._create_resource_key(resource),
+                                self._make_record(resource))
                             if self._stop_event.is_set():
                                 break
-                    watch_duration = time.monotonic() - start
-                    if watch_duration >= self.restart_seconds:
-                        break
+                        watch_duration = time.monotonic() - start
+                        if watch_duration >= self.restart_seconds:
+                            # Restart the watch (from our resource
+                            #  version, so this is cheap).
+                            break
                 except ReadTimeoutError:
                     # network read time out, just continue and restart
                     # the watch; this could be due to a network problem
                     # or just low activity
+                    self.metrics.inc("watch_read_timeouts")
                     continue
-                except Exception:
+                except Exception as exc:
+                    if isinstance(exc, ApiException) and exc.status == 410:
+                        # Our resource version is too old to resume from;
+                        #  relist right away.
+                        self.log.debug("Resource version %s gone;" %
+                                       self.resource_version +
+                                       " relisting.")
+                        self.metrics.inc("watch_gone")
+                        self.resource_version = None
+                        continue
+                    self.metrics.inc("watch_exceptions")
                     cur_delay = cur_delay * 2
                     if cur_delay > 30:
                         self.log.exception(
                             "Watching resources never recovered, giving up")
+                        self.metrics.inc("watch_failures")
                         if self.on_failure:
                             self.on_failure()
                         return
                     self.log.exception(
                         "Error when watching resources, retrying in" +
                         " %ss" % cur_delay)
+                    self.metrics.inc("backoff_sleeps")
+                    self.metrics.observe("backoff", cur_delay)
                     time.sleep(cur_delay)
                     continue
                 else:
-                    # no events on watch, reconnect
-                    pass
+                    if w.gone:
+                        # The client swallowed a 410; relist.
+                        self.log.debug("Resource version %s gone;" %
+                                       self.resource_version +
+                                       " relisting.")
+                        self.metrics.inc("watch_gone")
+                        self.resource_version = None
                 finally:
                     w.stop()
                     if self._stop_event.is_set():
                         break
 
+    def _watch_status(self, ev_type, obj):
+        # Handle an ERROR or BOOKMARK event, given its raw object.
+        if not isinstance(obj, dict):
+            obj = {}
+        if ev_type == 'ERROR':
+            # Older clients hand us the error status rather than raising
+            #  it.
+            if obj.get('code') == 410:
+                raise ApiException(status=410, reason="Gone")
+            raise ApiException(reason="Watch error: %r" % obj)
+        # Bookmarks only carry a resource version.
+        self.metrics.inc("watch_bookmarks")
+        rv = (obj.get('metadata') or {}).get('resourceVersion')
+        if rv:
+            self.resource_version = rv
+
     def start(self):
         """
         Start the reflection process!
@@ -177,7 +631,11 @@ class MultiNamespaceResourceReflector(NamespacedResourceReflector):
             raise ValueError('Thread watching for resources is already running'
                              )
 
-        self._list_and_update()
+        if self.instance_label_selector:
+            self.label_selector = ",".join(
+                [x for x in [self.label_selector,
+                             self.instance_label_selector] if x])
+        self.resource_version = self._list_and_update()
         self.watch_thread = threading.Thread(target=self._watch_and_update)
         # If the watch_thread is only thread left alive, exit app
         self.watch_thread.daemon = True
@@ -189,12 +647,142 @@ class MultiNamespaceEventReflector(MultiNamespaceResourceReflector):
 
     list_method_name = 'list_namespaced_event'
 
+    events_per_object = Int(
+        50,
+        config=True,
+        help="""
+        Keep at most this many of the most recent events for any one
+        object (pod); older ones are dropped from the store.
+        """
+    )
+
+    event_max_age = Int(
+        3600,
+        config=True,
+        help="""
+        Drop events older than this many seconds from the store.
+        """
+    )
+
+    def __init__(self, *args, **kwargs):
+        # Per involved object (namespace, name), a list of (timestamp,
+        #  key) in timestamp order, and for each event key, its slot.
+        self._buffers = {}
+        self._event_slots = {}
+        self._buffer_lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        super().__init__(*args, **kwargs)
+
+    def _record_from_dict(self, obj):
+        return CompactEvent.from_dict(obj)
+
+    def _event_time(self, ev_type, event):
+        # Events are updated in place as they recur, so use the latest
+        #  occurrence rather than the creation time.  Deletions are the
+        #  API server expiring old events, long after they happened.
+        if ev_type == 'DELETED':
+            return None
+        return event.last_timestamp or event.event_time
+
+    @staticmethod
+    def _event_timestamp(event):
+        ts = (event.last_timestamp or event.event_time or
+              getattr(event, 'first_timestamp', None))
+        if ts is None:
+            ts = datetime.datetime.now(datetime.timezone.utc)
+        return ts
+
+    @staticmethod
+    def _object_key(event):
+        io = event.involved_object
+        return (io.namespace or event.metadata.namespace, io.name)
+
+    def _buffer_add(self, key, event):
+        # Slot an event into its object's buffer; return the keys of the
+        #  events that pushes out (by count or age).
+        objkey = self._object_key(event)
+        ts = self._event_timestamp(event)
+        horizon = (datetime.datetime.now(datetime.timezone.utc) -
+                   datetime.timedelta(seconds=self.event_max_age))
+        evicted = []
+        with self._buffer_lock:
+            self._buffer_drop_locked(key)
+            buf = self._buffers.setdefault(objkey, [])
+            bisect.insort(buf, (ts, key))
+            self._event_slots[key] = (objkey, ts)
+            while buf and (len(buf) > self.events_per_object or
+                           buf[0][0] < horizon):
+                _, old = buf.pop(0)
+                self._event_slots.pop(old, None)
+                evicted.append(old)
+            if not buf:
+                del self._buffers[objkey]
+        return evicted
+
+    def _buffer_drop_locked(self, key):
+        slot = self._event_slots.pop(key, None)
+        if not slot:
+            return
+        objkey, ts = slot
+        buf = self._buffers.get(objkey, [])
+        idx = bisect.bisect_left(buf, (ts, key))
+        if idx < len(buf) and buf[idx] == (ts, key):
+            del buf[idx]
+        if not buf:
+            self._buffers.pop(objkey, None)
+
+    def _sweep(self):
+        # Expire old events for objects that have gone quiet.
+        now = time.monotonic()
+        if now - self._last_sweep < 60:
+            return []
+        self._last_sweep = now
+        horizon = (datetime.datetime.now(datetime.timezone.utc) -
+                   datetime.timedelta(seconds=self.event_max_age))
+        expired = []
+        with self._buffer_lock:
+            for buf in self._buffers.values():
+                while buf and buf[0][0] < horizon:
+                    expired.append(buf[0][1])
+                    self._event_slots.pop(buf.pop(0)[1], None)
+            for objkey in [k for k, v in self._buffers.items() if not v]:
+                del self._buffers[objkey]
+        return expired
+
+    def _store_put(self, key, record):
+        super()._store_put(key, record)
+        for old in self._buffer_add(key, record) + self._sweep():
+            super()._store_remove(old)
+
+    def _store_remove(self, key):
+        super()._store_remove(key)
+        with self._buffer_lock:
+            self._buffer_drop_locked(key)
+
+    def _store_replace(self, resources):
+        with self._buffer_lock:
+            self._buffers = {}
+            self._event_slots = {}
+        for key, event in list(resources.items()):
+            for old in self._buffer_add(key, event):
+                resources.pop(old, None)
+        super()._store_replace(resources)
+
+    def events_for(self, namespace, name):
+        """Return the retained events for one object, oldest first, in
+        time proportional to their number.
+        """
+        with self._buffer_lock:
+            keys = [k for _, k in self._buffers.get((namespace, name), [])]
+        events = [self.resources.get(k) for k in keys]
+        return [x for x in events if x is not None]
+
     @property
     def events(self):
-        return sorted(
-            self.resources.values(),
-            key=lambda event: event.last_timestamp or event.event_time,
-        )
+        with self._buffer_lock:
+            bufs = [list(x) for x in self._buffers.values()]
+        return [self.resources[k] for _, k in heapq.merge(*bufs)
+                if k in self.resources]
 
 
 class MultiNamespacePodReflector(MultiNamespaceResourceReflector):
@@ -209,9 +797,63 @@ class MultiNamespacePodReflector(MultiNamespaceResourceReflector):
     list_method_name = 'list_pod_for_all_namespaces'
     list_method_omit_namespace = True
 
+    indexers = {
+        'namespace': lambda p: p.metadata.namespace,
+        'username': lambda p: (p.metadata.labels or {}).get(
+            'hub.jupyter.org/username'),
+        'phase': lambda p: p.status.phase if p.status else None,
+        'node': lambda p: p.spec.node_name if p.spec else None,
+    }
+
+    compact_pods = Bool(
+        False,
+        config=True,
+        help="""
+        If True, store compact records holding only the pod fields the
+        spawner uses, rather than full pod objects, so that memory scales
+        with the number of pods rather than with their size.  Use
+        `get_full_pod()` for the full object.
+        """
+    )
+
     @property
     def pods(self):
         return self.resources
 
+    def pods_in_namespace(self, namespace):
+        return self.by_index('namespace', namespace)
+
+    def pods_for_user(self, username):
+        return self.by_index('username', username)
+
+    def pods_in_phase(self, phase):
+        return self.by_index('phase', phase)
+
+    def pods_on_node(self, node):
+        return self.by_index('node', node)
+
+    def _make_record(self, resource):
+        if self.compact_pods and not isinstance(resource, CompactPod):
+            return CompactPod.from_pod(resource)
+        return resource
+
+    def _record_from_dict(self, obj):
+        return CompactPod.from_dict(obj)
+
+    def get_full_pod(self, namespace, name):
+        """Return the full pod object for a pod in the store, reading it
+        from the API server if we only hold a compact record.  Return None
+        if there is no such pod.
+        """
+        pod = self.resources.get((namespace, name))
+        if pod is None or not isinstance(pod, CompactPod):
+            return pod
+        try:
+            return self.api.read_namespaced_pod(name, namespace)
+        except ApiException as exc:
+            if exc.status == 404:
+                return None
+            raise
+
     def _create_resource_key(self, resource):
         return (resource.metadata.namespace, resource.metadata.name)
@@ -7,8 +7,8 @@ implementation that should be used by JupyterHub.
 '''
 
 import sys
+import time
 from eliot import start_action
-from jupyterhub.utils import exponential_backoff
 from kubernetes import client, config
 from kubernetes.client.rest import ApiException
 from kubernetes.config.config_exception import ConfigException
@@ -77,6 +77,24 @@ class MultiNamespacedKubeSpawner(KubeSpawner):
             # pod doesn't exist or has been deleted
             return 1
 
+    @property
+    def events(self):
+        '''Return the events for the user's pod that we have not yet
+        reported, oldest first, from the event reflector's per-pod index.
+        '''
+        reflector = getattr(self, 'event_reflector', None)
+        if not reflector:
+            return []
+        last = getattr(self, '_last_event', None)
+        events = []
+        for event in reflector.events_for(self.namespace, self.pod_name):
+            if last and event.metadata.uid == last:
+                # skip over events we've already seen
+                events = []
+                continue
+            events.append(event)
+        return events
+
     @gen.coroutine
     def _start(self):
         '''Start the user's pod.
@@ -118,16 +136,16 @@ class MultiNamespacedKubeSpawner(KubeSpawner):
         # essentially ensures that this timeout should never propagate up
         # because the handler will have stopped waiting after
         # start_timeout, starting from a slightly earlier point.
+        # The reflector wakes us as soon as it sees the pod change.
         try:
-            yield exponential_backoff(
-                lambda: self.is_pod_running(self.pod_reflector.pods.get(
-                    (self.namespace, self.pod_name), None)),
+            yield self._wait_for_pod(
+                self.is_pod_running,
                 'pod/%s did not start in %s seconds!' % (
                     self.pod_name, self.start_timeout),
-                timeout=self.start_timeout,
             )
         except TimeoutError:
-            if self.pod_name not in self.pod_reflector.pods:
+            if ((self.namespace, self.pod_name) not in
+                    self.pod_reflector.pods):
                 # if pod never showed up at all,
                 # restart the pod reflector which may have
                 # become disconnected.
@@ -142,6 +160,36 @@ class MultiNamespacedKubeSpawner(KubeSpawner):
         self.pod_id = pod.metadata.uid
         return (pod.status.pod_ip, self.port)
 
+    @gen.coroutine
+    def _wait_for_pod(self, predicate, fail_message):
+        '''Wait up to `start_timeout` seconds for the user's pod record to
+        satisfy `predicate`, and return it.  If the pod reflector is
+        replaced meanwhile, carry on waiting on its replacement.
+        '''
+        key = (self.namespace, self.pod_name)
+        deadline = time.monotonic() + self.start_timeout
+        while True:
+            reflector = self.pod_reflector
+            try:
+                pod = yield reflector.wait_for(
+                    key, predicate,
+                    timeout=max(deadline - time.monotonic(), 0),
+                    fail_message=fail_message)
+                return pod
+            except TimeoutError:
+                if (reflector is self.pod_reflector or
+                        time.monotonic() >= deadline):
+                    raise
+
+    @gen.coroutine
+    def get_full_pod(self):
+        '''Return the full pod object for the user's pod (the reflector
+        may only hold a compact record of it), or None if there is none.
+        '''
+        pod = yield self.asynchronize(self.pod_reflector.get_full_pod,
+                                      self.namespace, self.pod_name)
+        return pod
+
     @gen.coroutine
     def stop(self, now=False):
         with start_action(action_type="stop"):
@@ -172,14 +220,10 @@ class MultiNamespacedKubeSpawner(KubeSpawner):
                 else:
                     raise
             try:
-                yield exponential_backoff(
-                    lambda: self.pod_reflector.pods.get((self.namespace,
-                                                         self.pod_name),
-                                                        None) is
-                    None,
+                yield self._wait_for_pod(
+                    lambda pod: pod is None,
                     'pod/%s did not disappear in %s seconds!' % (
                         self.pod_name, self.start_timeout),
-                    timeout=self.start_timeout,
                 )
             except TimeoutError:
                 self.log.error(
@@ -200,6 +244,22 @@ class MultiNamespacedKubeSpawner(KubeSpawner):
         return self._start_reflector("pods", MultiNamespacePodReflector,
                                      replace=replace)
 
+    def _reflector_scope(self, key):
+        '''Return extra keyword arguments (such as
+        `instance_label_selector` and `namespace_prefix`) that limit what
+        the `key` ("pods" or "events") reflector watches.  By default,
+        nothing is limited.
+        '''
+        return {}
+
+    def get_reflector_metrics(self):
+        '''Return a dict mapping each running reflector's key ("pods",
+        "events") to its metrics snapshot.
+        '''
+        return dict([(key, reflector.get_metrics()) for key, reflector in
+                     self.__class__.reflectors.items()
+                     if hasattr(reflector, 'get_metrics')])
+
     def _start_reflector(self, key, ReflectorClass, replace=True, **kwargs):
 
         def on_reflector_failure():
@@ -212,11 +272,13 @@ class MultiNamespacedKubeSpawner(KubeSpawner):
         previous_reflector = self.__class__.reflectors.get(key)
 
         if replace or not previous_reflector:
+            scope = self._reflector_scope(key)
+            scope.update(kwargs)
             self.__class__.reflectors[key] = ReflectorClass(
                 parent=self,
                 namespace=self.namespace,
                 on_failure=on_reflector_failure,
-                **kwargs,
+                **scope,
             )
 
         if replace and previous_reflector:
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+import datetime
+import sys
+from types import SimpleNamespace
+from kubernetes import config
+import jupyterhubutils as jhu
+
+# Stand in for the cluster: no kube config, and fake API clients.
+config.load_incluster_config = lambda: None
+sys.argv = ["prepuller", "--mode", "daemonset", "--timeout", "-1",
+            "--orphan-age", "3600"]
+
+
+class FakeAppsApi(object):
+    '''Holds DaemonSets whose controller wants no pods, and only catches up
+    with their spec on the second status read.
+    '''
+
+    def __init__(self, others):
+        self.others = others
+        self.created = []
+        self.reads = 0
+        self.deleted = []
+        self.collections = []
+
+    def create_namespaced_daemon_set(self, namespace, ds):
+        self.created.append(ds.metadata.name)
+
+    def read_namespaced_daemon_set_status(self, name, namespace):
+        self.reads += 1
+        return SimpleNamespace(
+            metadata=SimpleNamespace(name=name, generation=1),
+            status=SimpleNamespace(
+                desired_number_scheduled=0, number_ready=0,
+                updated_number_scheduled=0,
+                observed_generation=1 if self.reads > 1 else None))
+
+    def list_namespaced_daemon_set(self, namespace, label_selector=None):
+        self.list_selector = label_selector
+        return SimpleNamespace(items=self.others)
+
+    def delete_namespaced_daemon_set(self, name, namespace, **kwargs):
+        self.deleted.append(name)
+
+    def delete_collection_namespaced_daemon_set(self, namespace,
+                                                label_selector=None,
+                                                **kwargs):
+        self.collections.append(label_selector)
+
+
+def other_run(name, age):
+    created = (datetime.datetime.now(datetime.timezone.utc) -
+               datetime.timedelta(seconds=age))
+    return SimpleNamespace(metadata=SimpleNamespace(
+        name=name, creation_timestamp=created))
+
+
+lc = jhu.LSSTConfig()
+args = jhu.scanrepo.parse_args(cfg=lc, component="prepuller")
+q = jhu.Prepuller(args=args)
+q.nodes = ["node1"]
+q.daemonsets = [q._build_daemonset("prepuller",
+                                   ["lsstsqre/sciplat-lab:w_2020_01"])]
+api = FakeAppsApi([other_run("prepuller-old", 7200),
+                   other_run("prepuller-active", 60)])
+q.apps_client = api
+# A DaemonSet that schedules no pods is complete once the controller has
+#  seen it, not after the whole timeout...
+q.run_daemonsets(delay=0, max_tries=3)
+assert api.created == ["prepuller-" + q.run_id]
+assert api.reads == 2
+# ...and we delete only our own DaemonSets, and those of other runs that
+#  are old enough to be orphans.
+assert api.collections == [
+    "lsst.io/component=prepuller,lsst.io/prepuller-run=" + q.run_id]
+assert api.list_selector.endswith("lsst.io/prepuller-run!=" + q.run_id)
+assert api.deleted == ["prepuller-old"]
+# Until the controller catches up, no pods wanted may just mean it has
+#  not looked yet.
+api.reads = -10
+try:
+    q._wait_for_daemonsets(api.created, delay=0, max_tries=3)
+except RuntimeError:
+    pass
+else:
+    assert False, "DaemonSet complete before it was observed"
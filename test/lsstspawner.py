@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+from types import SimpleNamespace
+import jupyterhubutils as jhu
+# Only the cluster-wide pod reflector is scoped to this instance.  Call
+#  _reflector_scope() on a stand-in, since constructing a spawner needs a
+#  cluster.
+cfg = jhu.LSSTConfig()
+cfg.scope_reflectors = True
+cfg.instance_name = "test"
+hub = SimpleNamespace(_namespace_default=lambda: "hub")
+scope = jhu.LSSTSpawner._reflector_scope(hub, "pods")
+assert scope == {'namespace_prefix': "hub-",
+                 'instance_label_selector': "lsst.io/instance=test"}
+assert jhu.LSSTSpawner._reflector_scope(hub, "events") == {}
+# Unscoped, the pod reflector watches every namespace.
+cfg.scope_reflectors = False
+assert jhu.LSSTSpawner._reflector_scope(hub, "pods") == {}
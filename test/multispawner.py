@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+import asyncio
+import json
+from jupyterhubutils.spawner.compactpod import CompactEvent
+from jupyterhubutils.spawner.multispawner import MultiNamespacedKubeSpawner
+
+
+class EventReflector(object):
+    '''Holds compact events, as the event reflector does in raw_json mode.
+    '''
+
+    def __init__(self, events):
+        self.events = events
+
+    def events_for(self, namespace, name):
+        return [e for e in self.events
+                if (e.involved_object.namespace, e.involved_object.name) ==
+                (namespace, name)]
+
+
+class ProgressSpawner(MultiNamespacedKubeSpawner):
+    # Stand in for the shared reflector, rather than starting one.
+    event_reflector = None
+
+
+async def progress(spawner):
+    return [p async for p in spawner.progress()]
+
+
+def event(uid, reason, when):
+    return CompactEvent.from_dict({
+        "metadata": {"name": "nb-alice." + uid, "namespace": "nublado-alice",
+                     "uid": uid, "resourceVersion": "1",
+                     "creationTimestamp": "2020-01-02T03:04:05Z"},
+        "involvedObject": {"kind": "Pod", "name": "nb-alice",
+                           "namespace": "nublado-alice", "uid": "pod-1"},
+        "reason": reason, "message": reason + " it", "type": "Normal",
+        "count": 1, "lastTimestamp": when,
+        "eventTime": None})
+
+
+events = [event("ev-1", "Scheduled", "2020-01-02T03:04:05Z"),
+          event("ev-2", "Pulled", "2020-01-02T03:04:06.5Z")]
+# Compact events serialize the way the API server would have sent them.
+assert events[1].to_dict()["lastTimestamp"] == "2020-01-02T03:04:06.500000Z"
+assert events[1].to_dict()["involvedObject"]["uid"] == "pod-1"
+assert "eventTime" not in events[1].to_dict()
+# Skip __init__, which would load the cluster's configuration.
+spawner = ProgressSpawner.__new__(ProgressSpawner)
+spawner.pod_name = "nb-alice"
+spawner.namespace = "nublado-alice"
+spawner.event_reflector = EventReflector(events)
+loop = asyncio.new_event_loop()
+spawner._start_future = loop.create_future()
+spawner._start_future.set_result(None)
+reported = loop.run_until_complete(progress(spawner))
+reasons = [p["raw_event"]["reason"] for p in reported]
+assert reasons == ["Scheduled", "Pulled"]
+# What the hub sends on to the browser.
+json.dumps(reported)
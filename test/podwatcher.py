@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+import json
+import threading
+import time
+from types import SimpleNamespace
+from jupyterhubutils.scanrepo import podwatcher
+from jupyterhubutils.scanrepo.podwatcher import ExpiryWatch, PodWatcher
+# No API calls are made unless the watcher is started.
+pw = PodWatcher(None, 'default', 'app=prepuller')
+pw.register('pp-a')
+pw.stop()
+assert pw.wait('pp-a', timeout=5) is None
+pw.register('pp-b')
+assert pw.wait('pp-b', timeout=5) is None
+
+
+# The watch notes a 410 even when the client goes on to swallow it.
+w = ExpiryWatch()
+w.unmarshal_event(json.dumps({"type": "ERROR", "object": {
+    "kind": "Status", "code": 500, "reason": "InternalError"}}), None)
+assert not w.gone
+w.unmarshal_event(json.dumps({"type": "ERROR", "object": {
+    "kind": "Status", "code": 410, "reason": "Expired"}}), None)
+assert w.gone
+
+
+class QuietWatch(object):
+    '''A watch whose stream ends with no events, as an idle one does when
+    its timeout window closes.
+    '''
+    gone = False
+
+    def stream(self, func, *args, **kwargs):
+        self.streams.append(kwargs.get('resource_version'))
+        return iter([])
+
+    def stop(self):
+        pass
+
+
+class SwallowedWatch(QuietWatch):
+    '''A watch whose client swallowed a 410 and just ended the stream.
+    '''
+
+    def stream(self, func, *args, **kwargs):
+        self.gone = True
+        return super().stream(func, *args, **kwargs)
+
+
+class ListApi(object):
+    lists = 0
+
+    def list_namespaced_pod(self, namespace, label_selector=None):
+        self.lists += 1
+        return SimpleNamespace(items=[], metadata=SimpleNamespace(
+            resource_version="rv{}".format(self.lists)))
+
+
+def watched(watch_class, streams=3):
+    # Run the watcher, resuming from "old", until it has streamed a few
+    #  times, and return the API so we can count the relists.
+    watch_class.streams = []
+    podwatcher.ExpiryWatch = watch_class
+    api = ListApi()
+    pw = PodWatcher(api, 'default', 'app=prepuller')
+    pw.resource_version = "old"
+    stop = threading.Event()
+    thd = threading.Thread(target=pw._watch, args=(stop,))
+    thd.daemon = True
+    thd.start()
+    deadline = time.time() + 5
+    while len(watch_class.streams) < streams and time.time() < deadline:
+        time.sleep(0.01)
+    stop.set()
+    thd.join(5)
+    return api, pw
+
+
+# A quiet watch just resumes where it was...
+api, pw = watched(QuietWatch)
+assert api.lists == 0
+assert set(QuietWatch.streams) == {"old"}
+# ...but one whose 410 the client swallowed relists.
+api, pw = watched(SwallowedWatch)
+assert api.lists >= 1
+assert "old" not in SwallowedWatch.streams[1:]
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+import threading
+import time
+from jupyterhubutils.scanrepo.ratelimiter import RateLimiter
+
+# A burst goes through at once...
+limiter = RateLimiter(qps=20.0, burst=5)
+start = time.monotonic()
+for _ in range(5):
+    limiter.acquire()
+assert time.monotonic() - start < 0.1
+# ...and after that, requests are paced at qps, however many threads
+#  share the limiter.
+start = time.monotonic()
+threads = [threading.Thread(target=limiter.acquire) for _ in range(10)]
+for thd in threads:
+    thd.start()
+for thd in threads:
+    thd.join(5)
+elapsed = time.monotonic() - start
+assert 0.4 < elapsed < 1.5, elapsed
+# A non-positive qps disables limiting.
+limiter = RateLimiter(qps=0, burst=1)
+start = time.monotonic()
+for _ in range(100):
+    limiter.acquire()
+assert time.monotonic() - start < 0.1
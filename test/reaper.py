@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+import datetime
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+from jupyterhubutils.scanrepo import Reaper
+from jupyterhubutils.singleton import Singleton
+
+
+class FakeRegistry(object):
+    '''Stands in for the reaper's requests session, recording deletions.
+    '''
+
+    def __init__(self):
+        self.deleted = []
+
+    def delete(self, path, headers=None):
+        self.deleted.append(path.rsplit('/', 1)[-1])
+        return SimpleNamespace(status_code=202, headers={}, text='')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+def make_reaper(cachefile):
+    # Reaper is a singleton; get a fresh one, as a new process would.
+    Singleton._instances.pop(Reaper, None)
+    reaper = Reaper(host="registry.example.com", owner="lsstsqre",
+                    name="sciplat-lab", keep_experimentals=0,
+                    keep_dailies=0, keep_weeklies=1, cachefile=cachefile,
+                    scan_on_init=False)
+    registry = FakeRegistry()
+    reaper._make_session = lambda: registry
+    return reaper, registry
+
+
+def scanned(reaper, tags):
+    # Load scan results as if we had just scanned the repository.
+    for tag, (day, digest) in tags.items():
+        updated = datetime.datetime(2020, 1, day, 0, 0, 0, 1)
+        reaper._results_map[tag] = {
+            "name": tag, "hash": digest,
+            "last_updated": reaper._serialize_datetime(updated)}
+        reaper._name_to_manifest[tag] = {"hash": digest, "layers": None,
+                                         "updated": updated}
+    reaper._all_tags = reaper._sort_tags_by_date()
+    reaper.last_updated = datetime.datetime.utcnow()
+
+
+tmpdir = tempfile.mkdtemp()
+cachefile = os.path.join(tmpdir, "cache.json")
+planfile = os.path.join(tmpdir, "plan.json")
+reaper, registry = make_reaper(cachefile)
+scanned(reaper, {"recommended": (20, "sha256:aaa"),
+                 "w_2020_03": (20, "sha256:bbb"),
+                 "w_2020_02": (13, "sha256:aaa"),
+                 "w_2020_01": (6, "sha256:ccc")})
+reaper._writecachefile()
+plan = reaper.plan(planfile)
+# The weekly that "recommended" points at is kept at plan time...
+assert [v["tag"] for v in plan["victims"]] == ["w_2020_01"]
+assert not registry.deleted
+# ...and at apply time, from a fresh reaper that has not scanned, even if
+#  the plan names it (say, "recommended" moved after planning).
+plan["victims"].append({"tag": "w_2020_02", "digest": "sha256:aaa",
+                        "last_updated": None})
+with open(planfile, 'w') as f:
+    json.dump(plan, f)
+reaper, registry = make_reaper(cachefile)
+reaper.apply(planfile)
+assert registry.deleted == ["sha256:ccc"]
+assert reaper.reap_results["w_2020_01"]["deleted"]
+# A victim with no known digest is journalled as skipped, and a rerun
+#  of the plan does not try it again.
+plan["victims"] = [{"tag": "w_2019_52", "digest": None,
+                    "last_updated": None}]
+with open(planfile, 'w') as f:
+    json.dump(plan, f)
+reaper, registry = make_reaper(cachefile)
+reaper.apply(planfile)
+assert reaper.reap_results["w_2019_52"]["skipped"]
+with open(planfile + ".journal") as f:
+    assert "w_2019_52" in f.read()
+reaper, registry = make_reaper(cachefile)
+reaper.apply(planfile)
+assert not reaper.reapable
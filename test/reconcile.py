@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+import sys
+from types import SimpleNamespace
+from kubernetes import config
+import jupyterhubutils as jhu
+
+# Stand in for the cluster: no kube config, and a fake API client.
+config.load_incluster_config = lambda: None
+sys.argv = ["prepuller", "--timeout", "-1", "--repo", "hub.docker.com",
+            "--owner", "lsstsqre", "--name", "sciplat-lab",
+            "--skip-present", "--qps", "0"]
+IMAGE = "lsstsqre/sciplat-lab:recommended"
+
+
+class FakeRepo(object):
+    '''A repository scan that finds just "recommended", at a digest we
+    can move.
+    '''
+    debug = False
+
+    def __init__(self):
+        self.digest = "sha256:aaa"
+
+    def scan(self):
+        self.data = {"recommended": [{"name": "recommended",
+                                      "hash": self.digest}]}
+
+
+class FakeCoreV1Api(object):
+    '''Lists nodes, each with the image names it reports having.
+    '''
+
+    def __init__(self):
+        self.nodes = {}
+
+    def list_node(self):
+        return SimpleNamespace(items=[SimpleNamespace(
+            metadata=SimpleNamespace(name=name, labels={}),
+            spec=SimpleNamespace(unschedulable=False, taints=None),
+            status=SimpleNamespace(images=[SimpleNamespace(
+                names=images, size_bytes=None)]))
+            for name, images in sorted(self.nodes.items())])
+
+
+class FakeExecutor(object):
+    '''Records the lanes started, rather than running pulls.
+    '''
+
+    def __init__(self):
+        self.lanes = []
+
+    def submit(self, func, node):
+        self.lanes.append(node)
+
+
+lc = jhu.LSSTConfig()
+args = jhu.scanrepo.parse_args(cfg=lc, component="prepuller")
+q = jhu.Prepuller(args=args)
+repo = FakeRepo()
+api = FakeCoreV1Api()
+q.repo = repo
+q.client = api
+q._executor = FakeExecutor()
+
+
+def queued():
+    return sorted((n, q._spec_image(s), s.prepull_digest)
+                  for n, specs in q._node_queues.items() for s in specs)
+
+
+def drain():
+    # As if the lanes had run everything queued.
+    q._node_queues.clear()
+    q._node_lanes.clear()
+    q._executor.lanes = []
+
+
+api.nodes = {"node1": [], "node2": []}
+q.reconcile()
+assert queued() == [("node1", IMAGE, "sha256:aaa"),
+                    ("node2", IMAGE, "sha256:aaa")]
+assert sorted(q._executor.lanes) == ["node1", "node2"]
+drain()
+# Nothing new: nothing queued.
+q.reconcile()
+assert queued() == []
+# A moved tag is pulled again everywhere, except on a node that already
+#  has the new digest; the old keys are forgotten.
+repo.digest = "sha256:bbb"
+api.nodes["node2"] = ["docker.io/lsstsqre/sciplat-lab@sha256:bbb"]
+q.reconcile()
+assert queued() == [("node1", IMAGE, "sha256:bbb")]
+assert ("node2", IMAGE, "sha256:aaa") not in q.scheduled
+drain()
+# A node that leaves and comes back is prepulled again.
+del api.nodes["node1"]
+q.reconcile()
+assert queued() == []
+assert not [k for k in q.scheduled if k[0] == "node1"]
+api.nodes["node1"] = []
+q.reconcile()
+assert queued() == [("node1", IMAGE, "sha256:bbb")]
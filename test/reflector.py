@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+import asyncio
+import concurrent.futures
+import datetime
+import json
+import threading
+import time
+from types import SimpleNamespace
+from jupyterhubutils import Metrics
+from jupyterhubutils.spawner.compactpod import CompactEvent
+from jupyterhubutils.spawner.multireflector import (
+    ModelWatch, MultiNamespaceEventReflector)
+# Skip __init__, which would start watching the cluster.
+r = MultiNamespaceEventReflector.__new__(MultiNamespaceEventReflector)
+r.metrics = Metrics()
+# What stop() (called from __del__ at exit) needs.
+r._stop_event = threading.Event()
+r._store_lock = threading.Lock()
+r._waiters = {}
+old = CompactEvent(last_timestamp=(
+    datetime.datetime.now(datetime.timezone.utc) -
+    datetime.timedelta(seconds=3500)))
+# Expiry of an old event is not watch lag.
+r._observe_lag('DELETED', old)
+assert "watch_lag" not in r.metrics.snapshot()["timers"]
+r._observe_lag('MODIFIED', old)
+assert r.metrics.snapshot()["timers"]["watch_lag"]["last"] >= 3500
+
+
+# Watch streams as different kubernetes clients deliver them.  This one
+#  ended after the client saw, and swallowed, a 410.
+SWALLOWED_410 = object()
+
+
+class FakeWatch(object):
+    def __init__(self, reflector, streams):
+        self.reflector = reflector
+        self.streams = list(streams)
+        self.gone = False
+
+    def stream(self, func, **kwargs):
+        events = self.streams.pop(0)
+        if not self.streams:
+            self.reflector._stop_event.set()
+        self.gone = events is SWALLOWED_410
+        if self.gone:
+            events = []
+        return iter(events)
+
+    def stop(self):
+        pass
+
+
+def watched(streams, resource_version="old"):
+    r = MultiNamespaceEventReflector.__new__(MultiNamespaceEventReflector)
+    r.metrics = Metrics()
+    r._stop_event = threading.Event()
+    r._store_lock = threading.Lock()
+    r._waiters = {}
+    r.label_selector = ''
+    r.field_selector = ''
+    r.api = SimpleNamespace(list_namespaced_event=None)
+    r.first_load_future = concurrent.futures.Future()
+    r.resource_version = resource_version
+    fake = FakeWatch(r, streams)
+    r._make_watch = lambda: fake
+    r.lists = 0
+
+    def relist():
+        r.lists += 1
+        return "listed"
+
+    r._list_and_update = relist
+    r._watch_and_update()
+    return r
+
+
+bookmark = {'kind': 'Event', 'apiVersion': 'v1',
+            'metadata': {'resourceVersion': '42'}}
+gone = {'kind': 'Status', 'apiVersion': 'v1', 'status': 'Failure',
+        'code': 410, 'reason': 'Expired'}
+# Client 17+: bookmark objects are plain dicts.
+r = watched([[{'type': 'BOOKMARK', 'object': bookmark,
+               'raw_object': bookmark}]])
+assert r.resource_version == '42'
+assert r.lists == 0
+assert r.metrics.get_counter("watch_exceptions") == 0
+# Client 11: the error status is deserialized into the watched kind.
+r = watched([[{'type': 'ERROR', 'object': SimpleNamespace(metadata=None),
+               'raw_object': gone}], []])
+assert r.lists == 1
+assert r.metrics.get_counter("watch_gone") == 1
+# Clients 12-16 with timeout_seconds: the 410 is swallowed.
+r = watched([SWALLOWED_410, []])
+assert r.lists == 1
+assert r.metrics.get_counter("watch_gone") == 1
+# A quiet watch just times out; we resume rather than relist.
+r = watched([[], [], []])
+assert r.lists == 0
+assert r.resource_version == "old"
+assert r.metrics.get_counter("watch_gone") == 0
+# ModelWatch leaves bookmarks and errors as dicts, whatever the kind.
+w = ModelWatch()
+ev = w.unmarshal_event(json.dumps({'type': 'BOOKMARK', 'object': bookmark}),
+                       'V1Event')
+assert ev['object'] == bookmark
+assert w.resource_version == '42'
+assert not w.gone
+ev = w.unmarshal_event(json.dumps({'type': 'ERROR', 'object': gone}),
+                       'V1Pod')
+assert ev['raw_object']['code'] == 410
+assert w.gone
+
+
+# Stopping a reflector releases whoever is waiting on it.
+async def wait_then_stop(r):
+    loop = asyncio.get_event_loop()
+    loop.call_later(0.1, r.stop)
+    start = time.monotonic()
+    try:
+        await r.wait_for('pod', lambda x: x is not None, timeout=30)
+    except TimeoutError:
+        return time.monotonic() - start
+    raise AssertionError("wait_for returned for a missing pod")
+
+
+r = watched([[]])
+r._stop_event.clear()
+assert asyncio.run(wait_then_stop(r)) < 5
+assert not r._waiters
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+import datetime
+from jupyterhubutils.scanrepo import (RetentionEngine, CountPolicy,
+                                      AgePolicy, CombinedPolicy)
+from jupyterhubutils.scanrepo.retention import TagRecord, categorize_tag
+
+now = datetime.datetime(2020, 3, 1)
+
+
+def record(name, days_old):
+    return TagRecord(name=name, category=categorize_tag(name),
+                     updated=now - datetime.timedelta(days=days_old),
+                     digest=None)
+
+
+# Newest first, as the engine hands them to policies.
+weeklies = [record("w_2020_08", 1), record("w_2020_07", 8),
+            record("w_2020_06", 15), record("w_2020_02", 50)]
+count = CountPolicy(keep=1)
+age = AgePolicy(max_age=10)
+assert count.select_victims(weeklies, now) == {
+    "w_2020_07", "w_2020_06", "w_2020_02"}
+assert age.select_victims(weeklies, now) == {"w_2020_06", "w_2020_02"}
+# By default, anything either policy keeps is kept...
+assert CombinedPolicy([count, age]).select_victims(weeklies, now) == {
+    "w_2020_06", "w_2020_02"}
+# ...or, with require_all False, anything either would delete goes.
+assert CombinedPolicy([count, age], require_all=False).select_victims(
+    weeklies, now) == {"w_2020_07", "w_2020_06", "w_2020_02"}
+try:
+    CombinedPolicy([])
+except ValueError:
+    pass
+else:
+    assert False, "CombinedPolicy accepted no policies"
+# The engine sorts each category itself, keeps categories without a
+#  policy, and never reaps uncategorized tags; victims come oldest first.
+records = list(reversed(weeklies)) + [record("d_2020_02_01", 29),
+                                      record("recommended", 100),
+                                      record("r19_0_0", 400)]
+assert categorize_tag("recommended") is None
+engine = RetentionEngine({"weekly": CombinedPolicy([count, age])})
+assert engine.select_victims(records, now=now) == ["w_2020_02", "w_2020_06"]